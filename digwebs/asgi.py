@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+__author__ = 'SLZ'
+
+'''
+Helpers that adapt ASGI scope and messages to the WSGI style environ used by Request.
+'''
+
+import tempfile
+from io import BytesIO
+
+from .errors import HttpError
+
+def make_environ(scope, body=b''):
+    '''
+    Build a WSGI style environ from an ASGI http scope and the request body, as bytes or a
+    file-like object.
+
+    >>> env = make_environ({'method': 'POST', 'path': '/a b', 'query_string': b'x=1',
+    ...     'headers': [(b'content-type', b'text/plain'), (b'x-id', b'1'), (b'x-id', b'2')]}, b'hi')
+    >>> env['REQUEST_METHOD'], env['PATH_INFO'], env['QUERY_STRING']
+    ('POST', '/a b', 'x=1')
+    >>> env['CONTENT_TYPE'], env['HTTP_X_ID'], env['wsgi.input'].read()
+    ('text/plain', '1,2', b'hi')
+    >>> make_environ({'method': 'GET', 'path': '/',
+    ...     'headers': [(b'cookie', b'a=1'), (b'cookie', b'b=2')]})['HTTP_COOKIE']
+    'a=1; b=2'
+    '''
+    server = scope.get('server') or ('localhost', 80)
+    env = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body) if isinstance(body, bytes) else body,
+        'asgi.scope': scope,
+    }
+    client = scope.get('client')
+    if client:
+        env['REMOTE_ADDR'] = client[0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        if key in env:
+            # HTTP/2 sends each cookie as its own header:
+            value = env[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+        env[key] = value
+    return env
+
+async def read_body(receive, max_size=None, spool_size=512 * 1024):
+    '''
+    Read the request body from ASGI http.request messages into a file-like object, kept in
+    memory up to spool_size bytes and then written to a temporary file. Raise HttpError 413
+    once the body is larger than max_size.
+
+    >>> import asyncio
+    >>> messages = [{'type': 'http.request', 'body': b'ab', 'more_body': True},
+    ...     {'type': 'http.request', 'body': b'cd'}]
+    >>> async def receive():
+    ...     return messages.pop(0)
+    >>> asyncio.run(read_body(receive)).read()
+    b'abcd'
+    >>> messages = [{'type': 'http.request', 'body': b'ab', 'more_body': True},
+    ...     {'type': 'http.request', 'body': b'cd'}]
+    >>> asyncio.run(read_body(receive, 3))
+    Traceback (most recent call last):
+      ...
+    digwebs.errors.HttpError: 413 Request Entity Too Large
+    '''
+    body = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    size = 0
+    more_body = True
+    try:
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if max_size is not None and size > max_size:
+                raise HttpError(413)
+            body.write(chunk)
+            more_body = message.get('more_body', False)
+    except BaseException:
+        body.close()
+        raise
+    body.seek(0)
+    return body
+
+async def send_response(send, status, headers, body):
+    '''
+    Send status as '200 OK', headers as [(key, value)] and the iterable body.
+    '''
+    await send({
+        'type': 'http.response.start',
+        'status': int(status[:3]),
+        'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+    })
+    try:
+        for chunk in body:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+async def lifespan(receive, send):
+    '''
+    Acknowledge ASGI lifespan startup and shutdown messages.
+    '''
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+if __name__=='__main__':
+    import doctest
+    doctest.testmod()
@@ -2,17 +2,110 @@
 
 __author__ = 'SLZ'
 
+'''
+Parsers of request bodies by media type, see Request.get_body.
+'''
+
 import json
+from io import BytesIO
 
-def get_parser(file_type):
-    return _parse_map.get(file_type,_default_parser)
+from .common import parse_header
+from .errors import HttpError
+
+BLOCK_SIZE = 64 * 1024
+
+_parse_map = {}
+
+def register_parser(media_type, parser, stream=False):
+    '''
+    Register parser for bodies of media_type, e.g. 'application/json'. It is called as
+    parser(data, charset) with the body as bytes and the charset parameter of the
+    Content-Type or None. With stream=True it is called as parser(fp, charset, max_record_size)
+    instead and reads the body from the file-like fp itself, so it can return records while
+    they arrive, raising HttpError 413 for a record larger than max_record_size bytes.
+    '''
+    _parse_map[media_type.lower()] = (parser, stream)
+
+def find_parser(content_type):
+    '''
+    Return (parser, stream, charset) for a Content-Type header value. Types with a +json
+    suffix use the parser of application/json, unknown types get the body as bytes.
 
-_parse_map= {}
+    >>> find_parser('application/json; charset=UTF-8')[0] is _parse_to_json
+    True
+    >>> find_parser('application/vnd.api+json')[0] is _parse_to_json
+    True
+    >>> find_parser('application/octet-stream')[0] is _default_parser
+    True
+    '''
+    media_type, params = parse_header(content_type)
+    media_type = media_type.lower()
+    entry = _parse_map.get(media_type)
+    if entry is None and media_type.endswith('+json'):
+        entry = _parse_map.get('application/json')
+    if entry is None:
+        entry = (_default_parser, False)
+    return entry[0], entry[1], params.get('charset')
 
-def _default_parser(data_in_bytes):
+def get_parser(file_type):
+    '''
+    Return a function parsing a whole body of Content-Type file_type given as bytes.
+    '''
+    parser, stream, charset = find_parser(file_type)
+    if stream:
+        return lambda data: parser(BytesIO(data), charset, None)
+    return lambda data: parser(data, charset)
+
+def _default_parser(data_in_bytes, charset=None):
     return data_in_bytes
 
-def _parse_to_json(data_in_bytes,encoding='utf-8'):
-    return json.loads(data_in_bytes.decode(encoding))
+def _parse_to_json(data_in_bytes, charset=None):
+    '''
+    >>> _parse_to_json(b'{"a": [1, 2]}')
+    {'a': [1, 2]}
+    >>> _parse_to_json('{"a": "挖"}'.encode('gbk'), 'GBK')
+    {'a': '挖'}
+    '''
+    if charset and charset.lower().replace('-', '') not in ('utf8', 'utf16', 'utf32'):
+        data_in_bytes = data_in_bytes.decode(charset)
+    return json.loads(data_in_bytes)
+
+def _iter_ndjson(fp, charset=None, max_record_size=None):
+    r'''
+    Yield the JSON value of each non-blank line read from fp, one at a time. Raise HttpError
+    413 for a line longer than max_record_size bytes.
+
+    >>> list(_iter_ndjson(BytesIO(b'{"a": 1}\n\n[2]\n3')))
+    [{'a': 1}, [2], 3]
+    >>> list(_iter_ndjson(BytesIO(b'[1]\n[1, 2, 3]\n'), None, 5))
+    Traceback (most recent call last):
+      ...
+    digwebs.errors.HttpError: 413 Request Entity Too Large
+    '''
+    buf = bytearray()
+    while True:
+        block = fp.read(BLOCK_SIZE)
+        if not block:
+            break
+        lines = block.split(b'\n')
+        buf += lines[0]
+        if len(lines) > 1:
+            lines[0] = buf
+            buf = bytearray(lines.pop())
+            for line in lines:
+                if max_record_size is not None and len(line) > max_record_size:
+                    raise HttpError(413)
+                if line.strip():
+                    yield _parse_to_json(line, charset)
+        if max_record_size is not None and len(buf) > max_record_size:
+            raise HttpError(413)
+    if buf.strip():
+        yield _parse_to_json(buf, charset)
+
+register_parser('application/json', _parse_to_json)
+register_parser('application/x-ndjson', _iter_ndjson, stream=True)
+register_parser('application/jsonl', _iter_ndjson, stream=True)
 
-_parse_map['application/json'] = _parse_to_json
\ No newline at end of file
+if __name__=='__main__':
+    import doctest
+    doctest.testmod()
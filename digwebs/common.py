@@ -2,7 +2,8 @@
 
 __author__ = 'SLZ'
 
-import urllib
+import urllib, threading
+from collections import OrderedDict
 
 class Dict(dict):
     '''
@@ -48,6 +49,107 @@ class Dict(dict):
     def __setattr__(self, key, value):
         self[key] = value
 
+class ReadOnlyDict(Dict):
+    '''
+    A Dict which can not be changed after it is created.
+
+    >>> d = ReadOnlyDict(a=1)
+    >>> d.a, d['a']
+    (1, 1)
+    >>> d['b'] = 2
+    Traceback (most recent call last):
+        ...
+    TypeError: 'ReadOnlyDict' object does not support item assignment
+    >>> d.b = 2
+    Traceback (most recent call last):
+        ...
+    TypeError: 'ReadOnlyDict' object does not support item assignment
+    '''
+    def _readonly(self, *args, **kw):
+        raise TypeError("'%s' object does not support item assignment" % self.__class__.__name__)
+
+    __setitem__ = __delitem__ = __setattr__ = __delattr__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+class LRUCache(object):
+    '''
+    A thread safe cache which drops the least recently used items when it holds more than maxsize items,
+    or when the total weight of its items, as given by weigh(value), is more than maxweight.
+    A maxsize of 0 disables the cache.
+
+    >>> c = LRUCache(2)
+    >>> c.set('a', 1)
+    >>> c.set('b', 2)
+    >>> c.get('a')
+    1
+    >>> c.set('c', 3)
+    >>> c.get('b')
+    >>> c.get('b', 'DEFAULT')
+    'DEFAULT'
+    >>> len(c), c.hits, c.misses
+    (2, 1, 2)
+    >>> c = LRUCache(100, maxweight=10, weigh=len)
+    >>> c.set('a', b'12345')
+    >>> c.set('b', b'1234')
+    >>> c.set('c', b'123')
+    >>> c.get('a'), c.weight
+    (None, 7)
+    >>> c.set('d', b'12345678901')
+    >>> c.get('d'), len(c)
+    (None, 2)
+    '''
+    def __init__(self, maxsize=128, maxweight=None, weigh=None):
+        self.maxsize = maxsize
+        self.maxweight = maxweight
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self._weigh = weigh
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key][0]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        w = self._weigh(value) if self._weigh else 0
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.weight -= old[1]
+            if self.maxweight is not None and w > self.maxweight:
+                return
+            self._data[key] = (value, w)
+            self.weight += w
+            while len(self._data) > self.maxsize or (self.maxweight is not None and self.weight > self.maxweight):
+                self.weight -= self._data.popitem(last=False)[1][1]
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return default
+            self.weight -= item[1]
+            return item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def __len__(self):
+        return len(self._data)
+
 def quote(s, encoding='utf-8',safe='/'):
     '''
     Url quote as str.
@@ -85,6 +187,43 @@ def to_str(s, encoding='utf-8'):
         return s.decode(encoding)
     return str(s)
 
+def _split_params(s):
+    while s[:1] == ';':
+        s = s[1:]
+        end = s.find(';')
+        while end > 0 and (s.count('"', 0, end) - s.count('\\"', 0, end)) % 2:
+            end = s.find(';', end + 1)
+        if end < 0:
+            end = len(s)
+        yield s[:end].strip()
+        s = s[end:]
+
+def parse_header(line):
+    '''
+    Parse a header value like Content-Type into the main value and a dict of parameters,
+    with parameter names in lowercase.
+
+    >>> parse_header('multipart/form-data; boundary="a;b"; Charset=UTF-8')
+    ('multipart/form-data', {'boundary': 'a;b', 'charset': 'UTF-8'})
+    >>> parse_header('form-data; name="file"; filename="a \\\\"b\\\\".txt"')
+    ('form-data', {'name': 'file', 'filename': 'a "b".txt'})
+    >>> parse_header('')
+    ('', {})
+    '''
+    parts = _split_params(';' + (line or ''))
+    key = next(parts)
+    params = {}
+    for p in parts:
+        i = p.find('=')
+        if i < 0:
+            continue
+        name = p[:i].strip().lower()
+        value = p[i + 1:].strip()
+        if len(value) >= 2 and value[0] == value[-1] == '"':
+            value = value[1:-1].replace('\\\\', '\\').replace('\\"', '"')
+        params[name] = value
+    return key, params
+
 if __name__=='__main__':
     import doctest
     doctest.testmod()
\ No newline at end of file
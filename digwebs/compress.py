@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+__author__ = 'SLZ'
+
+'''
+gzip and deflate compression of response bodies.
+'''
+
+import zlib
+
+from .static import negotiate_encoding, is_compressible
+
+# zlib wbits of each Content-Encoding, in order of preference:
+ENCODINGS = (('gzip', 31), ('deflate', 15))
+
+def _header(headers, name):
+    name = name.lower()
+    for k, v in headers:
+        if k.lower() == name:
+            return v
+    return None
+
+def _to_bytes(chunk):
+    if isinstance(chunk, str):
+        return chunk.encode('utf-8')
+    return chunk
+
+def _close(body):
+    if hasattr(body, 'close'):
+        body.close()
+
+def _compress_stream(compressor, head, rest, body, flush_size):
+    '''
+    Compress the chunks in head, then those left in the iterator rest. Output is flushed
+    once flush_size bytes were compressed since the last flush, so the client receives data
+    while the application produces it without a flush marker after every small chunk.
+    '''
+    try:
+        data = b''.join(compressor.compress(chunk) for chunk in head)
+        yield data + compressor.flush(zlib.Z_SYNC_FLUSH)
+        pending = 0
+        for chunk in rest:
+            chunk = _to_bytes(chunk)
+            if not chunk:
+                continue
+            data = compressor.compress(chunk)
+            pending += len(chunk)
+            if pending >= flush_size:
+                data += compressor.flush(zlib.Z_SYNC_FLUSH)
+                pending = 0
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        _close(body)
+
+def compress_response(accept_encoding, method, status, headers, body, level=6, min_size=1024):
+    '''
+    Return (headers, body) with body compressed by the encoding of Accept-Encoding the client
+    prefers, or unchanged for responses other than 200, content types not worth compressing
+    and bodies smaller than min_size.
+
+    A list body is compressed at once and gets a Content-Length. Any other iterable is
+    compressed while it is iterated, reading no further ahead than min_size, and the
+    compressed output is flushed after about every min_size bytes of input.
+
+    For HEAD requests body must be the one of GET: the headers are the same as for GET and
+    the body returned is empty.
+
+    >>> import gzip
+    >>> headers, body = compress_response('gzip', 'GET', '200 OK',
+    ...     [('Content-Type', 'text/html'), ('Content-Length', '2000')], [b'a' * 2000], 6, 100)
+    >>> sorted(headers)
+    [('Content-Encoding', 'gzip'), ('Content-Length', '35'), ('Content-Type', 'text/html'), ('Vary', 'Accept-Encoding')]
+    >>> gzip.decompress(b''.join(body)) == b'a' * 2000
+    True
+    >>> headers, body = compress_response('deflate', 'GET', '200 OK',
+    ...     [('Content-Type', 'application/json')], iter([b'[1', b', 2]'] * 100), 6, 100)
+    >>> zlib.decompress(b''.join(body)) == b'[1, 2]' * 100
+    True
+    >>> compress_response('gzip', 'GET', '200 OK', [('Content-Type', 'text/html')], [b'tiny'], 6, 100)
+    ([('Content-Type', 'text/html'), ('Vary', 'Accept-Encoding')], [b'tiny'])
+    >>> compress_response('gzip', 'GET', '200 OK', [('Content-Type', 'image/png')], [b'a' * 200], 6, 100)[0]
+    [('Content-Type', 'image/png')]
+    >>> headers, body = compress_response('gzip', 'HEAD', '200 OK',
+    ...     [('Content-Type', 'text/html'), ('ETag', '"1"')], [b'a' * 2000], 6, 100)
+    >>> sorted(headers), body
+    ([('Content-Encoding', 'gzip'), ('Content-Length', '35'), ('Content-Type', 'text/html'), ('ETag', '"1-gzip"'), ('Vary', 'Accept-Encoding')], [])
+    '''
+    if method == 'HEAD':
+        headers, data = compress_response(accept_encoding, 'GET', status, headers, body, level, min_size)
+        _close(data)
+        _close(body)
+        return headers, []
+    if not status.startswith('200'):
+        return headers, body
+    content_type = _header(headers, 'Content-Type')
+    if not content_type or not is_compressible(content_type.split(';', 1)[0].strip().lower()):
+        return headers, body
+    if _header(headers, 'Content-Encoding') is not None:
+        return headers, body
+    headers = list(headers)
+    vary = _header(headers, 'Vary')
+    if vary is None:
+        headers.append(('Vary', 'Accept-Encoding'))
+    elif 'accept-encoding' not in vary.lower():
+        headers = [(k, v) for k, v in headers if k.lower() != 'vary']
+        headers.append(('Vary', vary + ', Accept-Encoding'))
+    encoding = negotiate_encoding(accept_encoding, [e for e, _ in ENCODINGS])
+    if encoding is None:
+        return headers, body
+    content_length = _header(headers, 'Content-Length')
+    if content_length is not None and content_length.isdigit() and int(content_length) < min_size:
+        return headers, body
+    compressor = zlib.compressobj(level, zlib.DEFLATED, dict(ENCODINGS)[encoding])
+    etag = _header(headers, 'ETag')
+    compressed = [(k, v) for k, v in headers if k.lower() not in ('content-length', 'etag')]
+    compressed.append(('Content-Encoding', encoding))
+    if etag and etag.endswith('"'):
+        compressed.append(('ETag', '%s-%s"' % (etag[:-1], encoding)))
+    if isinstance(body, (list, tuple)):
+        chunks = [_to_bytes(chunk) for chunk in body]
+        if sum(len(chunk) for chunk in chunks) < min_size:
+            return headers, chunks
+        data = b''.join(compressor.compress(chunk) for chunk in chunks) + compressor.flush()
+        compressed.append(('Content-Length', str(len(data))))
+        return compressed, [data]
+    rest = iter(body)
+    head = []
+    size = 0
+    for chunk in rest:
+        chunk = _to_bytes(chunk)
+        head.append(chunk)
+        size += len(chunk)
+        if size >= min_size:
+            break
+    else:
+        _close(body)
+        return headers, head
+    return compressed, _compress_stream(compressor, head, rest, body, max(min_size, 1))
+
+class CompressMiddleware(object):
+    '''
+    WSGI middleware compressing the responses of app, see compress_response. app must call
+    start_response before it returns the body, and return the body of GET for HEAD requests.
+    '''
+
+    def __init__(self, app, level=6, min_size=1024):
+        self.app = app
+        self.level = level
+        self.min_size = min_size
+
+    def __call__(self, env, start_response):
+        captured = []
+
+        def _start_response(status, headers, exc_info=None):
+            captured[:] = [status, headers, exc_info]
+
+        body = self.app(env, _start_response)
+        status, headers, exc_info = captured
+        headers, body = compress_response(
+            env.get('HTTP_ACCEPT_ENCODING'), env.get('REQUEST_METHOD'), status, headers, body,
+            self.level, self.min_size)
+        start_response(status, headers, exc_info)
+        return body
+
+if __name__=='__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+__author__ = 'SLZ'
+
+import contextvars
+
+class RequestContext(object):
+    '''
+    Context object for storing application, request and response of the current request.
+
+    The attributes live in a dict held by one contextvars.ContextVar. bind() installs a new dict
+    and returns a token, reset(token) restores the previous one, so each thread and each asyncio
+    task serving a request sees its own values.
+
+    >>> c = RequestContext()
+    >>> token = c.bind(request='r')
+    >>> c.request
+    'r'
+    >>> c.user = 'bob'
+    >>> c.user
+    'bob'
+    >>> c.reset(token)
+    >>> c.request
+    Traceback (most recent call last):
+      ...
+    AttributeError: request
+
+    Requests handled by concurrent asyncio tasks do not see each other:
+
+    >>> import asyncio
+    >>> async def handle(i):
+    ...     token = c.bind(request=i)
+    ...     try:
+    ...         await asyncio.sleep(0.01 * (3 - i))
+    ...         return c.request
+    ...     finally:
+    ...         c.reset(token)
+    >>> async def serve():
+    ...     return await asyncio.gather(*[handle(i) for i in range(3)])
+    >>> asyncio.run(serve())
+    [0, 1, 2]
+
+    Neither do requests handled by a thread pool:
+
+    >>> import time
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> def work(i):
+    ...     token = c.bind(request=i)
+    ...     try:
+    ...         time.sleep(0.01 * (3 - i))
+    ...         return c.request
+    ...     finally:
+    ...         c.reset(token)
+    >>> with ThreadPoolExecutor(3) as pool:
+    ...     list(pool.map(work, range(3)))
+    [0, 1, 2]
+    '''
+
+    def __init__(self):
+        object.__setattr__(self, '_var', contextvars.ContextVar('digwebs.ctx'))
+
+    def bind(self, **kw):
+        '''
+        Replace all attributes of the current context with kw, return a token for reset().
+        '''
+        return self._var.set(kw)
+
+    def reset(self, token):
+        '''
+        Restore the attributes which were current before bind() returned token.
+        '''
+        self._var.reset(token)
+
+    def __getattr__(self, name):
+        try:
+            return self._var.get()[name]
+        except LookupError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        state = self._var.get(None)
+        if state is None:
+            state = {}
+            self._var.set(state)
+        state[name] = value
+
+    def __delattr__(self, name):
+        try:
+            del self._var.get()[name]
+        except LookupError:
+            raise AttributeError(name)
+
+if __name__=='__main__':
+    import doctest
+    doctest.testmod()
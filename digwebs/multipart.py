@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+__author__ = 'SLZ'
+
+'''
+Streaming parser of multipart/form-data request bodies.
+'''
+
+import tempfile
+
+from .common import parse_header
+from .errors import HttpError, badrequest
+
+BLOCK_SIZE = 64 * 1024
+
+# max bytes of the headers of one part:
+MAX_HEADER_SIZE = 16 * 1024
+
+class MultipartFile(object):
+    '''
+    Multipart file storage get from request input.
+
+    f = ctx.request['file']
+    f.filename # 'test.png'
+    f.file # file-like object, in memory for small files, else a temporary file on disk
+    f.data # the content as bytes, read from f.file on first access
+    '''
+    def __init__(self, filename, file, content_type=None, size=0):
+        self.filename = filename
+        self.file = file
+        self.content_type = content_type
+        self.size = size
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self.file.seek(0)
+            self._data = self.file.read()
+            self.file.seek(0)
+        return self._data
+
+def _read_blocks(fp, length, max_body_size):
+    if length is not None and max_body_size is not None and length > max_body_size:
+        raise HttpError(413)
+    total = 0
+    while length is None or total < length:
+        size = BLOCK_SIZE if length is None else min(BLOCK_SIZE, length - total)
+        block = fp.read(size)
+        if not block:
+            break
+        total += len(block)
+        if max_body_size is not None and total > max_body_size:
+            raise HttpError(413)
+        yield block
+
+class _Part(object):
+
+    def __init__(self, headers, charset, spool_size, max_field_size):
+        disposition, params = parse_header(headers.get('content-disposition', ''))
+        if disposition.lower() != 'form-data' or 'name' not in params:
+            raise badrequest()
+        self.name = params['name']
+        # an empty file input is sent with filename="", keep it a plain field as cgi did:
+        self.filename = params.get('filename') or None
+        self.content_type = headers.get('content-type')
+        self.charset = parse_header(self.content_type)[1].get('charset', charset) if self.content_type else charset
+        self.max_field_size = max_field_size
+        self.size = 0
+        if self.filename is None:
+            self.buf = bytearray()
+        else:
+            self.buf = tempfile.SpooledTemporaryFile(max_size=spool_size)
+
+    def write(self, data):
+        self.size += len(data)
+        if self.filename is not None:
+            self.buf.write(data)
+            return
+        if self.max_field_size is not None and self.size > self.max_field_size:
+            raise HttpError(413)
+        self.buf.extend(data)
+
+    def value(self):
+        if self.filename is None:
+            return bytes(self.buf).decode(self.charset, 'replace')
+        self.buf.seek(0)
+        return MultipartFile(self.filename, self.buf, self.content_type, self.size)
+
+def _parse_headers(data, charset):
+    headers = {}
+    for line in data.split(b'\r\n'):
+        name, sep, value = line.decode(charset, 'replace').partition(':')
+        if not sep:
+            raise badrequest()
+        headers[name.strip().lower()] = value.strip()
+    return headers
+
+def parse_multipart(fp, boundary, length=None, charset='utf-8', max_parts=1000,
+        max_field_size=1024 * 1024, max_body_size=None, spool_size=512 * 1024):
+    r'''
+    Parse a multipart/form-data body read from fp in blocks, return [(name, value)] where
+    value is str for fields and MultipartFile for files.
+
+    Files are written as they arrive to memory and then, past spool_size bytes, to a temporary
+    file. Raise HttpError 413 for more than max_parts parts, a field larger than max_field_size
+    or a body larger than max_body_size, and 400 for a malformed body.
+
+    >>> from io import BytesIO
+    >>> body = (b'--xx\r\nContent-Disposition: form-data; name="a"\r\n\r\n1\r\n'
+    ...     b'--xx\r\nContent-Disposition: form-data; name="f"; filename="t.txt"\r\n'
+    ...     b'Content-Type: text/plain\r\n\r\njust a test\r\n--xx--\r\n')
+    >>> parts = parse_multipart(BytesIO(body), 'xx', len(body))
+    >>> parts[0]
+    ('a', '1')
+    >>> f = parts[1][1]
+    >>> f.filename, f.content_type, f.data
+    ('t.txt', 'text/plain', b'just a test')
+    >>> empty = b'--xx\r\nContent-Disposition: form-data; name="f"; filename=""\r\n\r\n\r\n--xx--\r\n'
+    >>> parse_multipart(BytesIO(empty), 'xx', len(empty))
+    [('f', '')]
+    >>> parse_multipart(BytesIO(body), 'xx', len(body), max_parts=1)
+    Traceback (most recent call last):
+      ...
+    digwebs.errors.HttpError: 413 Request Entity Too Large
+    '''
+    delimiter = b'--' + boundary.encode('latin-1')
+    body_delimiter = b'\r\n' + delimiter
+    keep = len(body_delimiter) - 1
+    parts = []
+    part = None
+    state = 'preamble'
+    buf = bytearray()
+    for block in _read_blocks(fp, length, max_body_size):
+        buf += block
+        while True:
+            if state == 'preamble':
+                i = buf.find(delimiter)
+                if i < 0:
+                    del buf[:-len(delimiter)]
+                    break
+                del buf[:i + len(delimiter)]
+                state = 'delimiter'
+            elif state == 'delimiter':
+                if len(buf) < 2:
+                    break
+                if buf[:2] == b'--':
+                    state = 'end'
+                    break
+                if buf[:2] != b'\r\n':
+                    raise badrequest()
+                del buf[:2]
+                state = 'headers'
+            elif state == 'headers':
+                i = buf.find(b'\r\n\r\n')
+                if i < 0:
+                    if len(buf) > MAX_HEADER_SIZE:
+                        raise HttpError(413)
+                    break
+                if len(parts) >= max_parts:
+                    raise HttpError(413)
+                part = _Part(_parse_headers(bytes(buf[:i]), charset), charset, spool_size, max_field_size)
+                del buf[:i + 4]
+                state = 'body'
+            elif state == 'body':
+                i = buf.find(body_delimiter)
+                if i < 0:
+                    if len(buf) > keep:
+                        part.write(bytes(buf[:-keep]))
+                        del buf[:-keep]
+                    break
+                part.write(bytes(buf[:i]))
+                del buf[:i + len(body_delimiter)]
+                parts.append((part.name, part.value()))
+                part = None
+                state = 'delimiter'
+        if state == 'end':
+            break
+    if state != 'end':
+        raise badrequest()
+    return parts
+
+if __name__=='__main__':
+    import doctest
+    doctest.testmod()
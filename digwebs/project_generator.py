@@ -84,10 +84,25 @@ def hello_world():
     return %s
 """ % '"""'+ html_content + '"""'
 
+def precompile(args):
+  if len(args) < 1:
+    print('Usage: digwebs precompile <your-web-service-directory> [template-cache-folder]')
+    return
+  from digwebs.web import digwebs
+  cache_folder = args[1] if len(args) > 1 else 'template_cache'
+  app = digwebs(root_path=os.path.abspath(args[0]), template_bytecode_cache=cache_folder)
+  app._init_template_engine(os.path.join(app.root_path, app.template_folder))
+  count = app.precompile_templates()
+  print('Precompiled %d templates into %s' % (count, os.path.join(app.root_path, cache_folder)))
+
 def gen():
   argc = len(sys.argv)
   if argc < 2:
     print('Usage: digwebs <your-web-service-directory>')
+    print('       digwebs precompile <your-web-service-directory> [template-cache-folder]')
+    return
+  if sys.argv[1] == 'precompile':
+    precompile(sys.argv[2:])
     return
   web_service_name = sys.argv[1]
   dir_path = os.getcwd()
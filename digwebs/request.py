@@ -2,86 +2,203 @@
 
 __author__ = 'SLZ'
 
-import cgi, urllib
+import urllib
 
-from .common import to_str, unquote, Dict
-from .body_parser import get_parser
+from types import MappingProxyType
+
+from .common import to_str, unquote, Dict, ReadOnlyDict, parse_header
+from .body_parser import find_parser
+from .errors import badrequest, HttpError
+from .multipart import MultipartFile, parse_multipart
 import urllib.parse
 
-class MultipartFile(object):
+def _min_limit(*limits):
+    limits = [l for l in limits if l is not None]
+    return min(limits) if limits else None
+
+class _BodyReader(object):
+    '''
+    File-like reader of at most length bytes of fp, or up to EOF if length is None, raising
+    HttpError 413 once more than limit bytes are read.
     '''
-    Multipart file storage get from request input.
 
-    f = ctx.request['file']
-    f.filename # 'test.png'
-    f.file # file-like object
+    def __init__(self, fp, length, limit):
+        self._fp = fp
+        self._remaining = length
+        self._limit = limit
+        self._total = 0
+
+    def read(self, size=-1):
+        if self._remaining is not None:
+            if size < 0 or size > self._remaining:
+                size = self._remaining
+            if size == 0:
+                return b''
+        data = self._fp.read(size)
+        self._total += len(data)
+        if self._remaining is not None:
+            self._remaining -= len(data)
+        if self._limit is not None and self._total > self._limit:
+            raise HttpError(413)
+        return data
+
+# header names by environ key, shared by requests instead of built for each one:
+_header_names = {}
+MAX_HEADER_NAMES = 1024
+
+def _header_name(key):
     '''
-    def __init__(self, storage):
-        self.filename = to_str(storage.filename)
-        self.file = storage.file
-        self.data = storage.file.read()
-
-import tempfile
-from email.parser import FeedParser
-class CustomFieldStorage(cgi.FieldStorage):
-    def __init__(self, *args, **kwargs):
-        cgi.FieldStorage.__init__(self, *args, **kwargs)
-
-    def make_file(self):
-        if self._binary_file or self.length >= 0:
-            return tempfile.TemporaryFile("wb+")
-        else:
-            return tempfile.TemporaryFile("w+",
-                encoding=self.encoding, newline = '\n')
-    
-    def __getattr__(self, name):
-        if name != 'value':
-            raise AttributeError(name)
-        if self.file:
-            self.file.seek(0)
-            value = self.file.read()
-            self.file.seek(0)
-        elif self.list is not None:
-            value = self.list
+    Convert 'HTTP_ACCEPT_ENCODING' to 'ACCEPT-ENCODING'.
+    '''
+    name = _header_names.get(key)
+    if name is None:
+        name = key[5:].replace('_', '-').upper()
+        if len(_header_names) < MAX_HEADER_NAMES:
+            _header_names[key] = name
+    return name
+
+def _to_multidict(pairs):
+    d = dict()
+    for key, value in pairs:
+        values = d.get(key)
+        if values is None:
+            d[key] = [value]
         else:
-            value = None
-        return value
-
-import json
+            values.append(value)
+    return d
 
 class Request(object):
     '''
     Request object for obtaining all http request information.
     '''
 
+    # limits of form bodies, None for no limit:
+    max_form_parts = 1000
+    max_form_field_size = 1024 * 1024
+    max_form_size = 2 * 1024 * 1024
+    # limit of bodies read whole into memory by get_body, and of each record of streamed ones:
+    max_parsed_body_size = 16 * 1024 * 1024
+    # limit of bodies get_body parses while they are read, e.g. NDJSON:
+    max_streamed_body_size = 256 * 1024 * 1024
+    # limit of every body, e.g. multipart uploads and bodies the ASGI application spools:
+    max_body_size = 1024 * 1024 * 1024
+    # uploaded files larger than this are written to a temporary file:
+    spool_size = 512 * 1024
+
+    # parsed values are computed on first use, None until then:
+    __slots__ = (
+        '_environ', '_query', '_form', '_query_first', '_raw_input', '_path_info', '_host',
+        '_headers', '_headers_view', '_cookies')
+
     def __init__(self, environ):
         self._environ = environ
+        self._query = None
+        self._form = None
+        self._query_first = True
+        self._raw_input = None
+        self._path_info = None
+        self._host = None
+        self._headers = None
+        self._headers_view = None
+        self._cookies = None
 
-    def _parse_input(self):
-        def _convert(item):
-            if isinstance(item, list):
-                return [to_str(i.value) for i in item]
-            if item.filename:
-                return MultipartFile(item)
-            return to_str(item.value)
-        fs = CustomFieldStorage(fp=self._environ['wsgi.input'], environ=self._environ, keep_blank_values=True)
-        received_data = fs.value
-        if isinstance(received_data,list):
-            inputs = dict()
-            for key in fs:
-                inputs[key] = _convert(fs[key])
-        else:
-            raise ValueError('unknown received data type')
-        return inputs
+    def _read_body(self, limit):
+        '''
+        Read exactly CONTENT_LENGTH bytes of the body, or up to EOF without CONTENT_LENGTH.
+        Raise HttpError 413 if the body is larger than limit.
+        '''
+        fp = self._environ['wsgi.input']
+        content_length = self._environ.get('CONTENT_LENGTH')
+        if content_length:
+            length = int(content_length)
+            if limit is not None and length > limit:
+                raise HttpError(413)
+            return fp.read(length)
+        data = fp.read() if limit is None else fp.read(limit + 1)
+        if limit is not None and len(data) > limit:
+            raise HttpError(413)
+        return data
+
+    def _body_stream(self, limit):
+        content_length = self._environ.get('CONTENT_LENGTH')
+        length = int(content_length) if content_length else None
+        if length is not None and limit is not None and length > limit:
+            raise HttpError(413)
+        return _BodyReader(self._environ['wsgi.input'], length, limit)
+
+    def _parse_form(self):
+        '''
+        Parse a form body into [(name, value)], return it with True if the query string goes
+        before the body when both are merged, as cgi did for multipart bodies.
+        '''
+        env = self._environ
+        if env.get('REQUEST_METHOD') in ('GET', 'HEAD'):
+            return [], True
+        content_type, params = parse_header(env.get('CONTENT_TYPE', ''))
+        content_type = content_type.lower()
+        charset = params.get('charset', 'utf-8')
+        if content_type == 'multipart/form-data':
+            if not params.get('boundary'):
+                raise badrequest()
+            content_length = env.get('CONTENT_LENGTH')
+            return parse_multipart(
+                env['wsgi.input'],
+                params['boundary'],
+                int(content_length) if content_length else None,
+                charset,
+                self.max_form_parts,
+                self.max_form_field_size,
+                self.max_body_size,
+                self.spool_size), True
+        if content_type in ('', 'application/x-www-form-urlencoded'):
+            body = self._read_body(_min_limit(self.max_form_size, self.max_body_size)).decode(charset, 'replace')
+            return urllib.parse.parse_qsl(body, keep_blank_values=True, encoding=charset, errors='replace'), False
+        return [], True
+
+    def _get_query(self):
+        '''
+        Get the query string parameters as dict of lists of str, parsed once.
+        '''
+        if self._query is None:
+            self._query = _to_multidict(urllib.parse.parse_qsl(self._environ.get('QUERY_STRING', ''), keep_blank_values=True))
+        return self._query
+
+    def _get_form(self):
+        '''
+        Get the form body parameters as dict of lists of str or MultipartFile, parsed once.
+        '''
+        if self._form is None:
+            pairs, self._query_first = self._parse_form()
+            self._form = _to_multidict(pairs)
+        return self._form
 
     def _get_raw_input(self):
         '''
-        Get raw input as dict containing values as unicode, list or MultipartFile.
-        '''
-        if not hasattr(self, '_raw_input'):
-            self._raw_input = self._parse_input()
+        Get raw input, the query string and form body parameters, as dict of lists of str or
+        MultipartFile values.
+        '''
+        if self._raw_input is None:
+            form = self._get_form()
+            query = self._get_query()
+            if not form or not query:
+                self._raw_input = form or query
+            else:
+                first, last = (query, form) if self._query_first else (form, query)
+                merged = dict((k, v[:]) for k, v in first.items())
+                for k, v in last.items():
+                    merged.setdefault(k, []).extend(v)
+                self._raw_input = merged
         return self._raw_input
 
+    def _get_input(self, source):
+        if source == 'both':
+            return self._get_raw_input()
+        if source == 'query':
+            return self._get_query()
+        if source == 'body':
+            return self._get_form()
+        raise ValueError('Unknown input source: %s' % source)
+
     def __getitem__(self, key):
         '''
         Get input parameter value. If the specified key has multiple value, the first one is returned.
@@ -111,14 +228,12 @@ class Request(object):
         >>> f.file.read()
         'just a test'
         '''
-        r = self._get_raw_input()[key]
-        if isinstance(r, list):
-            return r[0]
-        return r
+        return self._get_raw_input()[key][0]
 
-    def get(self, key, default=None):
+    def get(self, key, default=None, source='both'):
         '''
-        The same as request[key], but return default value if key is not found.
+        The same as request[key], but return default value if key is not found. source selects
+        the parameters of the 'query' string, the form 'body' or 'both'.
 
         >>> from StringIO import StringIO
         >>> r = Request({'REQUEST_METHOD':'POST', 'wsgi.input':StringIO('a=1&b=M%20M&c=ABC&c=XYZ&e=')})
@@ -128,14 +243,14 @@ class Request(object):
         >>> r.get('empty', 'DEFAULT')
         'DEFAULT'
         '''
-        r = self._get_raw_input().get(key, default)
-        if isinstance(r, list):
-            return r[0]
-        return r
+        values = self._get_input(source).get(key)
+        if values is None:
+            return default
+        return values[0]
 
-    def gets(self, key):
+    def gets(self, key, source='both'):
         '''
-        Get multiple values for specified key.
+        Get multiple values for specified key from the 'query' string, the form 'body' or 'both'.
 
         >>> from StringIO import StringIO
         >>> r = Request({'REQUEST_METHOD':'POST', 'wsgi.input':StringIO('a=1&b=M%20M&c=ABC&c=XYZ&e=')})
@@ -148,14 +263,12 @@ class Request(object):
             ...
         KeyError: 'empty'
         '''
-        r = self._get_raw_input()[key]
-        if isinstance(r, list):
-            return r[:]
-        return [r]
+        return self._get_input(source)[key][:]
 
-    def input(self, **kw):
+    def input(self, source='both', **kw):
         '''
         Get input as dict from request, fill dict using provided default value if key not exist.
+        source selects the parameters of the 'query' string, the form 'body' or 'both'.
 
         i = ctx.request.input(role='guest')
         i.role ==> 'guest'
@@ -177,14 +290,35 @@ class Request(object):
         2008
         '''
         copy = Dict(**kw)
-        raw = self._get_raw_input()
+        raw = self._get_input(source)
         for k, v in raw.items():
-            copy[k] = v[0] if isinstance(v, list) else v
+            copy[k] = v[0]
         return copy
 
     def get_body(self):
-        fp = self._environ['wsgi.input']
-        return get_parser(self._environ['CONTENT_TYPE'])(fp.read())
+        r'''
+        Parse the body by the parser registered in body_parser for its media type. JSON is
+        decoded, NDJSON returns an iterator of records parsed while the body is read, other types
+        are returned as bytes. Raise HttpError 413 if the body is larger than max_parsed_body_size,
+        or for streamed types, if it is larger than max_streamed_body_size or one of its records
+        larger than max_parsed_body_size.
+
+        >>> from io import BytesIO
+        >>> r = Request({'CONTENT_TYPE': 'application/json; charset=utf-8', 'CONTENT_LENGTH': '8',
+        ...     'wsgi.input': BytesIO(b'{"a": 1}')})
+        >>> r.get_body()
+        {'a': 1}
+        >>> r = Request({'CONTENT_TYPE': 'application/x-ndjson', 'CONTENT_LENGTH': '6',
+        ...     'wsgi.input': BytesIO(b'1\n[2]\n3')})
+        >>> list(r.get_body())
+        [1, [2]]
+        '''
+        parser, stream, charset = find_parser(self._environ.get('CONTENT_TYPE', ''))
+        if stream:
+            return parser(
+                self._body_stream(_min_limit(self.max_streamed_body_size, self.max_body_size)),
+                charset, self.max_parsed_body_size)
+        return parser(self._read_body(_min_limit(self.max_parsed_body_size, self.max_body_size)), charset)
 
     @property
     def remote_addr(self):
@@ -218,12 +352,17 @@ class Request(object):
         >>> r = Request({})
         >>> r.get_query_string()
         ''
-        >>> r = Request({'QUERY_STRING': 'a=1&b=2&b=3'})
+        >>> r = Request({'QUERY_STRING': 'a=1&b=2&b=3&c='})
         >>> r.get_query_string(to_json=True)
-        {'a': ['1'], 'b': ['2','3']}
+        {'a': ['1'], 'b': ['2', '3']}
         '''
         if to_json:
-            return urllib.parse.parse_qs(self._environ.get('QUERY_STRING', '')) 
+            query = {}
+            for k, v in self._get_query().items():
+                values = [i for i in v if i]
+                if values:
+                    query[k] = values
+            return query
         return self._environ.get('QUERY_STRING', '')
 
     @property
@@ -270,7 +409,9 @@ class Request(object):
         >>> r.path_info
         '/test/a b.html'
         '''
-        return urllib.parse.unquote(self._environ.get('PATH_INFO', ''))
+        if self._path_info is None:
+            self._path_info = urllib.parse.unquote(self._environ.get('PATH_INFO', ''))
+        return self._path_info
 
     @property
     def host(self):
@@ -281,35 +422,41 @@ class Request(object):
         >>> r.host
         'localhost:8080'
         '''
-        return self._environ.get('HTTP_HOST', '')
+        if self._host is None:
+            self._host = self._environ.get('HTTP_HOST', '')
+        return self._host
 
     def _get_headers(self):
-        if not hasattr(self, '_headers'):
+        if self._headers is None:
             hdrs = {}
             for k, v in self._environ.items():
                 if k.startswith('HTTP_'):
-                    # convert 'HTTP_ACCEPT_ENCODING' to 'ACCEPT-ENCODING'
-                    hdrs[k[5:].replace('_', '-').upper()] = v
+                    hdrs[_header_name(k)] = v
             self._headers = hdrs
         return self._headers
 
     @property
     def headers(self):
         '''
-        Get all HTTP headers with key as str and value as unicode. The header names are 'XXX-XXX' uppercase.
+        Get all HTTP headers as a read-only mapping with key as str and value as unicode.
+        The header names are 'XXX-XXX' uppercase.
 
         >>> r = Request({'HTTP_USER_AGENT': 'Mozilla/5.0', 'HTTP_ACCEPT': 'text/html'})
         >>> H = r.headers
         >>> H['ACCEPT']
-        u'text/html'
+        'text/html'
         >>> H['USER-AGENT']
-        u'Mozilla/5.0'
-        >>> L = H.items()
-        >>> L.sort()
-        >>> L
-        [('ACCEPT', u'text/html'), ('USER-AGENT', u'Mozilla/5.0')]
+        'Mozilla/5.0'
+        >>> sorted(H.items())
+        [('ACCEPT', 'text/html'), ('USER-AGENT', 'Mozilla/5.0')]
+        >>> H['ACCEPT'] = 'text/plain'
+        Traceback (most recent call last):
+          ...
+        TypeError: 'mappingproxy' object does not support item assignment
         '''
-        return dict(**self._get_headers())
+        if self._headers_view is None:
+            self._headers_view = MappingProxyType(self._get_headers())
+        return self._headers_view
 
     def header(self, header, default=None):
         '''
@@ -330,7 +477,7 @@ class Request(object):
         return self._get_headers().get(header.upper(), default)
 
     def _get_cookies(self):
-        if not hasattr(self, '_cookies'):
+        if self._cookies is None:
             cookies = {}
             cookie_str = self._environ.get('HTTP_COOKIE')
             if cookie_str:
@@ -338,21 +485,21 @@ class Request(object):
                     pos = c.find('=')
                     if pos>0:
                         cookies[c[:pos].strip()] = unquote(c[pos+1:])
-            self._cookies = cookies
+            self._cookies = ReadOnlyDict(**cookies)
         return self._cookies
 
     @property
     def cookies(self):
         '''
-        Return all cookies as dict. The cookie name is str and values is unicode.
+        Return all cookies as a read-only Dict. The cookie name is str and values is unicode.
 
         >>> r = Request({'HTTP_COOKIE':'A=123; url=http%3A%2F%2Fwww.example.com%2F'})
         >>> r.cookies['A']
-        u'123'
-        >>> r.cookies['url']
-        u'http://www.example.com/'
+        '123'
+        >>> r.cookies.url
+        'http://www.example.com/'
         '''
-        return Dict(**self._get_cookies())
+        return self._get_cookies()
 
     def cookie(self, name, default=None):
         '''
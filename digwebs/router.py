@@ -2,60 +2,17 @@
 
 __author__ = 'SLZ'
 
-import re, logging, mimetypes, os, types, importlib
+import re, logging, os, types, importlib
 
 from .errors import notfound, badrequest
-
-def _static_file_generator(fpath):
-    BLOCK_SIZE = 8192
-    with open(fpath, 'rb') as f:
-        block = f.read(BLOCK_SIZE)
-        while block:
-            yield block
-            block = f.read(BLOCK_SIZE)
-
-class StaticFileRoute(object):
-    def __init__(self):
-        self.method = 'GET'
-        self.is_static = False
-
-    def match(self, url):
-        if url.startswith('/static/'):
-            return (url[1:], )
-        return None
-
-    def __call__(self, context, *args):
-        fpath = os.path.join(context.application.document_root, args[0])
-        if not os.path.isfile(fpath):
-            raise notfound()
-        fext = os.path.splitext(fpath)[1]
-        context.response.content_type = mimetypes.types_map.get(fext.lower(), 'application/octet-stream')
-        return _static_file_generator(fpath)
-
-class FaviconFileRoute(object):
-
-    def __init__(self):
-        self.method = 'GET'
-        self.is_static = False
-
-    def match(self, url):
-        if url == '/favicon.ico':
-            return ('favicon.ico', )
-        return None
-
-    def __call__(self, context, *args):
-        fpath = os.path.join(context.application.document_root, args[0])
-        if not os.path.isfile(fpath):
-            raise notfound()
-        fext = os.path.splitext(fpath)[1]
-        context.response.content_type = mimetypes.types_map.get(fext.lower(), 'application/octet-stream')
-        return _static_file_generator(fpath)
+from .common import Dict, LRUCache
+from .static import StaticFileRoute, FaviconFileRoute, StaticFileCache
 
 _re_route = re.compile(r'(\:[a-zA-Z_]\w*)')
 
-def _build_regex(path):
+def _build_regex(path, capture=True):
     r'''
-    Convert route path to regex.
+    Convert route path to regex, variables become named groups unless capture is False.
 
     >>> _build_regex('/path/to/:file')
     '^\\/path\\/to\\/(?P<file>[^\\/]+)$'
@@ -63,6 +20,8 @@ def _build_regex(path):
     '^\\/(?P<user>[^\\/]+)\\/(?P<comments>[^\\/]+)\\/list$'
     >>> _build_regex(':id-:pid/:w')
     '^(?P<id>[^\\/]+)\\-(?P<pid>[^\\/]+)\\/(?P<w>[^\\/]+)$'
+    >>> _build_regex('/path/to/:file', False)
+    '^\\/path\\/to\\/[^\\/]+$'
     '''
     re_list = ['^']
     var_list = []
@@ -71,7 +30,10 @@ def _build_regex(path):
         if is_var:
             var_name = v[1:]
             var_list.append(var_name)
-            re_list.append(r'(?P<%s>[^\/]+)' % var_name)
+            if capture:
+                re_list.append(r'(?P<%s>[^\/]+)' % var_name)
+            else:
+                re_list.append(r'[^\/]+')
         else:
             s = ''
             for ch in v:
@@ -88,6 +50,28 @@ def _build_regex(path):
     re_list.append('$')
     return ''.join(re_list)
 
+def _route_segments(path):
+    '''
+    Split route path into segments for the route tree, a ':name' segment becomes None.
+    Return None if any segment mixes text and variables.
+
+    >>> _route_segments('/path/to/:file')
+    ['', 'path', 'to', None]
+    >>> _route_segments('/:user/:comments/list')
+    ['', None, None, 'list']
+    >>> _route_segments(':id-:pid/:w')
+    '''
+    segments = []
+    for seg in path.split('/'):
+        parts = _re_route.split(seg)
+        if len(parts) == 1:
+            segments.append(seg)
+        elif len(parts) == 3 and not parts[0] and not parts[2]:
+            segments.append(None)
+        else:
+            return None
+    return segments
+
 class Route(object):
     '''
     A Route object is a callable object.
@@ -97,8 +81,10 @@ class Route(object):
         self.path = func.__web_route__
         self.method = func.__web_method__
         self.is_static = _re_route.search(self.path) is None
+        self.segments = None
         if not self.is_static:
             self.route = re.compile(_build_regex(self.path))
+            self.segments = _route_segments(self.path)
         self.func = func
 
     def match(self, url):
@@ -117,6 +103,174 @@ class Route(object):
 
     __repr__ = __str__
 
+class _RouteNode(object):
+    __slots__ = ('children', 'wildcard', 'route')
+
+    def __init__(self):
+        self.children = {}
+        self.wildcard = None
+        self.route = None
+
+def _match_node(node, parts, i, args):
+    '''
+    Walk the route tree and return (index, route, args) of the first added route
+    that matches parts[i:], or None.
+    '''
+    if i == len(parts):
+        if node.route is None:
+            return None
+        return (node.route[0], node.route[1], tuple(args))
+    best = None
+    part = parts[i]
+    child = node.children.get(part)
+    if child is not None:
+        best = _match_node(child, parts, i + 1, args)
+    if node.wildcard is not None and part:
+        args.append(part)
+        found = _match_node(node.wildcard, parts, i + 1, args)
+        args.pop()
+        if found is not None and (best is None or found[0] < best[0]):
+            best = found
+    return best
+
+class TrieDispatcher(object):
+    '''
+    Match dynamic routes of one http method by a segment tree, static segments are
+    dict children and ':name' segments are wildcard children, so the cost of a lookup
+    depends on the depth of the url rather than the number of routes.
+
+    Routes that can not be split into segments (such as '/:id-:pid' or StaticFileRoute)
+    are matched one by one. If several routes match a url, the one added first wins.
+
+    >>> class R(object):
+    ...     def __init__(self, path):
+    ...         self.segments = _route_segments(path)
+    ...     def match(self, url):
+    ...         return None
+    >>> d = TrieDispatcher()
+    >>> a, b = R('/user/:id'), R('/user/me')
+    >>> d.add(a)
+    >>> d.add(b)
+    >>> d.match('/user/me') == (a, ('me',))
+    True
+    >>> d.match('/user/me/more')
+    '''
+
+    def __init__(self):
+        self.root = _RouteNode()
+        self.others = []
+        self.count = 0
+
+    def add(self, route):
+        index = self.count
+        self.count += 1
+        segments = getattr(route, 'segments', None)
+        if segments is None:
+            self.others.append((index, route))
+            return
+        node = self.root
+        for seg in segments:
+            if seg is None:
+                if node.wildcard is None:
+                    node.wildcard = _RouteNode()
+                node = node.wildcard
+            else:
+                child = node.children.get(seg)
+                if child is None:
+                    child = node.children[seg] = _RouteNode()
+                node = child
+        if node.route is None:
+            node.route = (index, route)
+
+    def match(self, url):
+        return _match_others(self.others, _match_node(self.root, url.split('/'), 0, []), url)
+
+class RegexDispatcher(object):
+    '''
+    Match dynamic routes of one http method by a single alternation regex, each route
+    ends with an empty named group so the lastindex of a match tells which route it is,
+    then only that route runs its own regex to get the args. Variables are not captured
+    in the alternation because sre saves every group mark on each branch it tries.
+
+    Objects other than Route (such as StaticFileRoute) are matched one by one. If several
+    routes match a url, the one added first wins.
+    '''
+
+    def __init__(self):
+        self.routes = []
+        self.others = []
+        self.count = 0
+        self._regex = None
+        self._routes = None
+
+    def add(self, route):
+        index = self.count
+        self.count += 1
+        if isinstance(route, Route):
+            self.routes.append((index, route))
+            self._regex = None
+        else:
+            self.others.append((index, route))
+
+    def _compile(self):
+        re_list = []
+        routes = [None]
+        for index, route in self.routes:
+            re_list.append('%s(?P<r%d>)' % (_build_regex(route.path, False)[1:-1], index))
+            routes.append((index, route))
+        self._routes = routes
+        self._regex = re.compile('^(?:%s)$' % '|'.join(re_list))
+
+    def match(self, url):
+        best = None
+        if self.routes:
+            if self._regex is None:
+                self._compile()
+            m = self._regex.match(url)
+            if m:
+                index, route = self._routes[m.lastindex]
+                best = (index, route, route.match(url))
+        return _match_others(self.others, best, url)
+
+class ListDispatcher(object):
+    '''
+    Match dynamic routes of one http method one by one in the order they were added.
+    '''
+
+    def __init__(self):
+        self.routes = []
+
+    def add(self, route):
+        self.routes.append(route)
+
+    def match(self, url):
+        for fn in self.routes:
+            args = fn.match(url)
+            if args:
+                return (fn, args)
+        return None
+
+def _match_others(others, best, url):
+    '''
+    Match the (index, route) list others one by one until the index passes the best
+    (index, route, args) found so far, return (route, args) or None.
+    '''
+    for index, fn in others:
+        if best is not None and index > best[0]:
+            break
+        args = fn.match(url)
+        if args:
+            return (fn, args)
+    if best is not None:
+        return (best[1], best[2])
+    return None
+
+_ROUTE_ENGINES = {
+    'trie': TrieDispatcher,
+    'regex': RegexDispatcher,
+    'list': ListDispatcher,
+}
+
 def _load_module(module_name):
     '''
     Load module from name as str.
@@ -143,21 +297,53 @@ class Router(object):
 
     def __init__(
         self,
-        is_develop_mode):
+        serve_static,
+        route_engine = 'trie',
+        route_cache_size = 1024,
+        notfound_cache_size = 256,
+        static_cache_control = None,
+        static_memory_cache = 0):
+        '''
+        Init a Router.
+
+        Args:
+          serve_static: serve /static/ and /favicon.ico if True.
+          route_engine: how dynamic routes are matched, 'trie' (segment tree),
+                        'regex' (one alternation regex per method) or 'list' (one by one).
+          route_cache_size: max number of (method, path) lookups of dynamic routes to remember, 0 to disable.
+          notfound_cache_size: max number of (method, path) lookups that ended in 404 to remember,
+                               kept apart so that scans of random urls can not evict found routes.
+          static_cache_control: dict of url prefix under /static/ to max-age, see StaticFileRoute.
+          static_memory_cache: bytes of small static files to hold in memory, 0 to disable.
+        '''
+        if route_engine not in _ROUTE_ENGINES:
+            raise ValueError('Unknown route engine: %s' % route_engine)
         self.static_method_to_route = {'GET':{},'POST':{},'PUT':{},'DELETE':{}}
         self.dynamic_method_to_route ={'GET':[],'POST':[],'PUT':[],'DELETE':[]}
-        if is_develop_mode:
-            self.dynamic_method_to_route['GET'].append(StaticFileRoute())
-            self.dynamic_method_to_route['GET'].append(FaviconFileRoute())
+        self.method_to_dispatcher = {}
+        self.route_cache = LRUCache(route_cache_size)
+        self.notfound_cache = LRUCache(notfound_cache_size)
+        for method in self.dynamic_method_to_route:
+            self.method_to_dispatcher[method] = _ROUTE_ENGINES[route_engine]()
+        if serve_static:
+            cache = StaticFileCache(static_memory_cache) if static_memory_cache > 0 else None
+            self.add_dynamic_route(StaticFileRoute(static_cache_control, cache))
+            self.add_dynamic_route(FaviconFileRoute(cache))
         
         self.func_to_route = {}
 
+    def add_dynamic_route(self, route):
+        self.dynamic_method_to_route[route.method].append(route)
+        self.method_to_dispatcher[route.method].add(route)
+        self.clear_cache()
+
     def create_route(self, func):
         route = Route(func)
         if route.is_static:
             self.static_method_to_route[route.method][route.path] = route
+            self.clear_cache()
         else:
-            self.dynamic_method_to_route[route.method].append(route)
+            self.add_dynamic_route(route)
         logging.info('Add route: %s' % str(route))
         return route
 
@@ -170,15 +356,59 @@ class Router(object):
                 self.func_to_route[name] = self.create_route(fn)
 
     def route_to(self, request_method,path_info):
-        fn = self.static_method_to_route[request_method].get(path_info, None)
+        '''
+        Return (route, args) for the request, HEAD is routed as GET. Only matches of Route
+        are cached: StaticFileRoute accepts any url under /static/ and answers 404 itself,
+        so caching its matches would let scans of random urls evict the dynamic routes.
+
+        >>> def user(id):
+        ...     return id
+        >>> user.__web_route__, user.__web_method__ = '/user/:id', 'GET'
+        >>> router = Router(False)
+        >>> router.create_route(user).path
+        '/user/:id'
+        >>> router.route_to('HEAD', '/user/7')[1]
+        ('7',)
+        '''
+        if request_method == 'HEAD':
+            request_method = 'GET'
+        static_routes = self.static_method_to_route.get(request_method)
+        if static_routes is None:
+            raise notfound()
+        fn = static_routes.get(path_info, None)
         if fn:
-            return (fn, [])
-        for fn in self.dynamic_method_to_route[request_method]:
-            args = fn.match(path_info)
-            if args:
-                return (fn, args)
+            return (fn, ())
+        key = (request_method, path_info)
+        r = self.route_cache.get(key)
+        if r:
+            return r
+        if self.notfound_cache.get(key):
+            raise notfound()
+        r = self.method_to_dispatcher[request_method].match(path_info)
+        if r:
+            if isinstance(r[0], Route):
+                self.route_cache.set(key, r)
+            return r
+        self.notfound_cache.set(key, True)
         raise notfound()
 
+    def clear_cache(self):
+        self.route_cache.clear()
+        self.notfound_cache.clear()
+
+    def cache_info(self):
+        '''
+        Return hits, misses and sizes of the route lookup caches as Dict.
+        '''
+        return Dict(
+            hits=self.route_cache.hits,
+            notfound_hits=self.notfound_cache.hits,
+            misses=self.notfound_cache.misses,
+            size=len(self.route_cache),
+            maxsize=self.route_cache.maxsize,
+            notfound_size=len(self.notfound_cache),
+            notfound_maxsize=self.notfound_cache.maxsize)
+
     def create_controller(self,root_path, controller_folder):
         controller_modules_path = os.path.join(root_path, controller_folder)
         importlib.import_module(controller_folder)
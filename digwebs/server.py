@@ -0,0 +1,609 @@
+#!/usr/bin/env python
+
+__author__ = 'SLZ'
+
+'''
+Built-in WSGI server with a thread pool per process and optional pre-forked worker processes.
+'''
+
+import os, sys, signal, socket, threading, time, logging, itertools, tempfile
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from io import BytesIO
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, ServerHandler
+from wsgiref.util import FileWrapper
+
+from .common import Dict
+
+# threads per process when serving HTTP/1.1 and no number of threads is given, each
+# persistent connection holds a thread until it is closed:
+HTTP11_THREADS = 32
+
+class _BadBody(Exception):
+    '''
+    A request body the server refuses before the application sees it, code is the status.
+    '''
+
+    def __init__(self, code):
+        Exception.__init__(self, code)
+        self.code = code
+
+class _InputStream(object):
+    r'''
+    wsgi.input that reads at most length bytes of the request body, so that the next
+    pipelined request on the connection is left untouched.
+
+    >>> f = _InputStream(BytesIO(b'a=1\nb=2GET / HTTP/1.1'), 7)
+    >>> f.readline(), f.read(), f.read()
+    (b'a=1\n', b'b=2', b'')
+    '''
+
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.remaining = length
+
+    def _limit(self, size):
+        if size is None or size < 0 or size > self.remaining:
+            return self.remaining
+        return size
+
+    def read(self, size=-1):
+        size = self._limit(size)
+        if not size:
+            return b''
+        data = self.rfile.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def readline(self, size=-1):
+        size = self._limit(size)
+        if not size:
+            return b''
+        data = self.rfile.readline(size)
+        self.remaining -= len(data)
+        return data
+
+    def readlines(self, hint=-1):
+        return list(iter(self.readline, b''))
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def drain(self):
+        while self.read(65536):
+            pass
+
+def _read_chunked(rfile, limit=None, spool_size=512 * 1024):
+    r'''
+    Read a request body sent with Transfer-Encoding: chunked, return (file, length) with the
+    body kept in memory up to spool_size bytes and then in a temporary file. Raise _BadBody
+    413 once it is larger than limit, 400 for a malformed chunk.
+
+    >>> f, length = _read_chunked(BytesIO(b'3\r\nabc\r\n2;x=y\r\nde\r\n0\r\nTrailer: 1\r\n\r\n'))
+    >>> f.read(), length
+    (b'abcde', 5)
+    >>> _read_chunked(BytesIO(b'3\r\nabc\r\n2\r\nde\r\n0\r\n\r\n'), 4)
+    Traceback (most recent call last):
+      ...
+    digwebs.server._BadBody: 413
+    '''
+    body = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    length = 0
+    try:
+        while True:
+            try:
+                size = int(rfile.readline(65537).split(b';', 1)[0], 16)
+            except ValueError:
+                raise _BadBody(400)
+            if size == 0:
+                while rfile.readline(65537) not in (b'\r\n', b'\n', b''):
+                    pass
+                body.seek(0)
+                return body, length
+            length += size
+            if limit is not None and length > limit:
+                raise _BadBody(413)
+            while size:
+                data = rfile.read(min(size, 65536))
+                if not data:
+                    raise _BadBody(400)
+                body.write(data)
+                size -= len(data)
+            rfile.readline(65537)
+    except BaseException:
+        body.close()
+        raise
+
+def _sendfile(connection, result, count):
+    '''
+    Send count bytes of the file in a wsgi.file_wrapper from its current position by
+    os.sendfile. Return False if the file can not be sent this way.
+    '''
+    f = result.filelike
+    if not hasattr(f, 'fileno') or count is None:
+        return False
+    try:
+        f.fileno()
+    except (AttributeError, OSError, ValueError):
+        return False
+    connection.sendfile(f, f.tell(), int(count))
+    return True
+
+class _SendfileServerHandler(ServerHandler):
+    '''
+    wsgiref ServerHandler which sends a wsgi.file_wrapper response by os.sendfile.
+    '''
+
+    wsgi_file_wrapper = FileWrapper
+
+    def sendfile(self):
+        count = self.headers.get('Content-Length')
+        if count is None or not hasattr(self.result.filelike, 'fileno'):
+            return False
+        if not self.headers_sent:
+            self.bytes_sent = int(count)
+            self.send_headers()
+        self._flush()
+        return _sendfile(self.request_handler.connection, self.result, count)
+
+class RequestHandler(WSGIRequestHandler):
+    '''
+    wsgiref WSGIRequestHandler which serves wsgi.file_wrapper responses by os.sendfile.
+    '''
+
+    def handle(self):
+        self.raw_requestline = self.rfile.readline(65537)
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
+            return
+        if not self.parse_request():
+            return
+        handler = _SendfileServerHandler(
+            self.rfile, self.wfile, self.get_stderr(), self.get_environ(),
+            multithread=True, multiprocess=self.server.multiprocess)
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+
+class HTTP11RequestHandler(WSGIRequestHandler):
+    '''
+    Request handler speaking HTTP/1.1 with persistent connections. Pipelined requests are
+    read one after another from the buffered connection. A connection is closed after
+    server.idle_timeout seconds without a request or after server.max_requests requests.
+
+    The response is framed by the Content-Length of the app, or by the length of a body
+    made of a single chunk, otherwise it is sent with Transfer-Encoding: chunked.
+    '''
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        self.timeout = self.server.idle_timeout
+        WSGIRequestHandler.setup(self)
+        self.requests = 0
+
+    handle = BaseHTTPRequestHandler.handle
+
+    def handle_one_request(self):
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+            if len(self.raw_requestline) > 65536:
+                self.requestline = ''
+                self.request_version = ''
+                self.command = ''
+                self.send_error(414)
+                return
+            if not self.raw_requestline:
+                self.close_connection = True
+                return
+            if not self.parse_request():
+                return
+            self.requests += 1
+            if self.requests >= self.server.max_requests or self.server.stopping:
+                self.close_connection = True
+            self.run_app()
+        except _BadBody as e:
+            self.close_connection = True
+            self.send_error(e.code)
+        except (socket.timeout, ConnectionError):
+            self.close_connection = True
+
+    def get_environ(self):
+        content_length = self.headers.get('content-length')
+        if content_length is not None and not (content_length.isascii() and content_length.isdigit()):
+            raise _BadBody(400)
+        env = WSGIRequestHandler.get_environ(self)
+        if self.headers.get('transfer-encoding', '').lower() == 'chunked':
+            body, length = _read_chunked(self.rfile, self.server.max_chunked_size)
+            env['CONTENT_LENGTH'] = str(length)
+            env['wsgi.input'] = body
+        else:
+            env['wsgi.input'] = _InputStream(self.rfile, int(env.get('CONTENT_LENGTH') or 0))
+        env['wsgi.errors'] = sys.stderr
+        env['wsgi.version'] = (1, 0)
+        env['wsgi.url_scheme'] = 'http'
+        env['wsgi.multithread'] = True
+        env['wsgi.multiprocess'] = self.server.multiprocess
+        env['wsgi.run_once'] = False
+        env['wsgi.file_wrapper'] = FileWrapper
+        return env
+
+    def run_app(self):
+        env = self.get_environ()
+        state = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and state.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            state['status'] = status
+            state['headers'] = headers
+            return state.setdefault('written', []).append
+
+        try:
+            result = self.server.get_app()(env, start_response)
+        except Exception:
+            self.server.handle_error(self.request, self.client_address)
+            self.close_connection = True
+            self.send_error(500)
+            return
+        try:
+            self.send_result(env, state, result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+            if isinstance(env['wsgi.input'], _InputStream):
+                env['wsgi.input'].drain()
+            else:
+                env['wsgi.input'].close()
+
+    def send_result(self, env, state, result):
+        if isinstance(result, FileWrapper) and 'status' in state and self.command != 'HEAD':
+            headers = dict((k.lower(), v) for k, v in state['headers'])
+            if 'content-length' in headers:
+                self.wfile.write(self.preamble(state['status'], state['headers']))
+                state['sent'] = True
+                if not _sendfile(self.connection, result, headers['content-length']):
+                    for data in result:
+                        self.wfile.write(data)
+                self.log_request(int(state['status'][:3]), headers['content-length'])
+                return
+        chunks = iter(result)
+        if state.get('written'):
+            chunks = itertools.chain(state['written'], chunks)
+            result = None
+        first = b''
+        try:
+            for first in chunks:
+                if first:
+                    break
+        except Exception:
+            # nothing is sent yet, so the client can still get a 500:
+            self.server.handle_error(self.request, self.client_address)
+            self.close_connection = True
+            self.send_error(500)
+            return
+        status = state['status']
+        headers = list(state['headers'])
+        code = int(status[:3])
+        names = set(k.lower() for k, v in headers)
+        no_body = self.command == 'HEAD' or code < 200 or code in (204, 304)
+        chunked = False
+        if no_body or 'content-length' in names:
+            pass
+        elif isinstance(result, (list, tuple)) and len(result) <= 1:
+            headers.append(('Content-Length', str(len(first))))
+        elif self.request_version == 'HTTP/1.1':
+            headers.append(('Transfer-Encoding', 'chunked'))
+            chunked = True
+        else:
+            self.close_connection = True
+        preamble = self.preamble(status, headers)
+        state['sent'] = True
+        size = 0
+        if no_body:
+            self.wfile.write(preamble)
+        elif chunked:
+            self.wfile.write(preamble + _chunk(first))
+            for data in chunks:
+                if data:
+                    size += len(data)
+                    self.wfile.write(_chunk(data))
+            self.wfile.write(b'0\r\n\r\n')
+        else:
+            self.wfile.write(preamble + first)
+            for data in chunks:
+                size += len(data)
+                self.wfile.write(data)
+        self.log_request(code, len(first) + size)
+
+    def preamble(self, status, headers):
+        '''
+        Return status line and headers as bytes, adding Connection, Date and Server.
+        '''
+        names = set(k.lower() for k, v in headers)
+        lines = ['%s %s\r\n' % (self.protocol_version, status)]
+        for k, v in headers:
+            lines.append('%s: %s\r\n' % (k, v))
+        if self.close_connection:
+            lines.append('Connection: close\r\n')
+        elif self.request_version != 'HTTP/1.1':
+            lines.append('Connection: keep-alive\r\n')
+        if 'date' not in names:
+            lines.append('Date: %s\r\n' % self.date_time_string())
+        if 'server' not in names:
+            lines.append('Server: %s\r\n' % self.version_string())
+        lines.append('\r\n')
+        return ''.join(lines).encode('latin-1')
+
+def _chunk(data):
+    if not data:
+        return b''
+    return b'%x\r\n%s\r\n' % (len(data), data)
+
+class ThreadPoolWSGIServer(WSGIServer):
+    '''
+    WSGIServer that handles connections in a bounded pool of threads. When all threads are
+    busy it stops accepting, so new connections wait in the listen backlog of the kernel.
+    '''
+
+    def __init__(self, server_address, handler_class=WSGIRequestHandler, threads=1, backlog=128, reuse_port=False, bind_and_activate=True, idle_timeout=5, max_requests=100, max_chunked_size=None):
+        self.request_queue_size = backlog
+        self.reuse_port = reuse_port
+        self.threads = threads
+        self.idle_timeout = idle_timeout
+        self.max_requests = max_requests
+        self.max_chunked_size = max_chunked_size
+        self.multiprocess = False
+        self.stopping = False
+        self._slots = threading.BoundedSemaphore(threads)
+        self._pool = ThreadPoolExecutor(threads)
+        WSGIServer.__init__(self, server_address, handler_class, bind_and_activate)
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        WSGIServer.server_bind(self)
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        self._pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def drain(self):
+        '''
+        Wait until the requests being handled are finished, persistent connections are
+        closed after their current request.
+        '''
+        self.stopping = True
+        self._pool.shutdown(wait=True)
+
+# set in the environment of workers started by exec after a reload, see _Master:
+WORKER_ENV = 'DIGWEBS_WORKER_FD'
+# set in the environment of a single process server started again by exec on SIGHUP:
+LISTEN_ENV = 'DIGWEBS_LISTEN_FD'
+
+def _make_server(host, port, app, options, fd=None):
+    '''
+    Make the server of a process, listening on the inherited socket fd if it is not None.
+    '''
+    handler_class = HTTP11RequestHandler if options.http11 else RequestHandler
+    server = ThreadPoolWSGIServer(
+        (host, port), handler_class, options.threads, options.backlog, options.reuse_port,
+        bind_and_activate=fd is None, idle_timeout=options.idle_timeout,
+        max_requests=options.max_requests, max_chunked_size=options.max_chunked_size)
+    if fd is not None:
+        server.socket.close()
+        server.socket = socket.socket(fileno=fd)
+        server.server_address = server.socket.getsockname()
+        server.server_name = socket.getfqdn(server.server_address[0])
+        server.server_port = server.server_address[1]
+        server.setup_environ()
+    server.set_app(app)
+    server.multiprocess = options.workers > 1
+    return server
+
+def _serve_until_signal(server, reload=False):
+    '''
+    Serve until SIGTERM or SIGINT, then stop accepting and finish the requests in flight.
+    With reload=True, SIGHUP finishes the requests in flight the same way and then runs the
+    command of the process again by exec, keeping the listening socket open so that new
+    connections wait in its backlog while the application is imported again.
+    '''
+    reloading = []
+
+    def stop(signum, frame):
+        logging.info('process %s draining...' % os.getpid())
+        # shutdown() waits for serve_forever() to return, so it must run in another thread.
+        threading.Thread(target=server.shutdown).start()
+
+    def on_reload(signum, frame):
+        reloading.append(signum)
+        stop(signum, frame)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    if reload:
+        signal.signal(signal.SIGHUP, on_reload)
+    try:
+        server.serve_forever()
+    finally:
+        server.drain()
+        if reloading:
+            logging.info('process %s reloading...' % os.getpid())
+            _exec(server.fileno(), LISTEN_ENV)
+        server.server_close()
+
+def _exec(fd, env_name):
+    '''
+    Replace the process by a new run of the command that started it, which imports the
+    application again and serves on the socket fd, or on its own socket if fd is -1, see
+    serve. env_name tells it whether it serves as a worker or as the only process.
+    '''
+    if fd >= 0:
+        os.set_inheritable(fd, True)
+    os.environ[env_name] = str(fd)
+    argv = getattr(sys, 'orig_argv', None)
+    argv = [sys.executable] + (argv[1:] if argv else sys.argv)
+    os.execv(sys.executable, argv)
+
+class _Master(object):
+    '''
+    Fork and watch worker processes. SIGTERM or SIGINT drains all workers and exits.
+
+    SIGHUP starts a new set of workers and then drains the old ones. The first workers are
+    forked with the application already imported by the master, workers started after a
+    reload run the command of the master again by exec, so they load the current code and
+    configuration of the application.
+    '''
+
+    def __init__(self, host, port, app, workers, options):
+        self.host = host
+        self.port = port
+        self.app = app
+        self.workers = workers
+        self.options = options
+        self.server = None
+        if not options.reuse_port:
+            # bind once, the workers accept on the inherited socket.
+            self.server = _make_server(host, port, app, options)
+        self.pids = set()
+        self.running = True
+        self.reloading = False
+        self.reexec = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.pids.add(pid)
+            return
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        code = 0
+        try:
+            if self.reexec:
+                _exec(self.server.fileno() if self.server else -1, WORKER_ENV)
+            server = self.server
+            if server is None:
+                server = _make_server(self.host, self.port, self.app, self.options)
+            _serve_until_signal(server)
+        except Exception as e:
+            logging.exception(e)
+            code = 1
+        finally:
+            os._exit(code)
+
+    def kill(self, pids, sig=signal.SIGTERM):
+        for pid in pids:
+            try:
+                os.kill(pid, sig)
+            except OSError:
+                pass
+
+    def reap(self):
+        while self.pids:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.pids.clear()
+                return
+            if not pid:
+                return
+            self.pids.discard(pid)
+
+    def run(self):
+        def on_stop(signum, frame):
+            self.running = False
+
+        def on_reload(signum, frame):
+            self.reloading = True
+
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGINT, on_stop)
+        signal.signal(signal.SIGHUP, on_reload)
+        for i in range(self.workers):
+            self.spawn()
+        while self.running:
+            self.reap()
+            if self.reloading:
+                self.reloading = False
+                self.reexec = True
+                logging.info('reloading %d workers...' % self.workers)
+                old = set(self.pids)
+                for i in range(self.workers):
+                    self.spawn()
+                self.kill(old)
+            while self.running and len(self.pids) < self.workers:
+                self.spawn()
+            time.sleep(0.2)
+        logging.info('stopping %d workers...' % len(self.pids))
+        self.kill(self.pids)
+        while self.pids:
+            self.reap()
+            time.sleep(0.1)
+        if self.server:
+            self.server.server_close()
+
+def serve(app, host='127.0.0.1', port=9999, workers=1, threads=None, backlog=128, reuse_port=False, http11=False, idle_timeout=5, max_requests=100, max_chunked_size=16 * 1024 * 1024):
+    '''
+    Serve the WSGI app until SIGTERM or SIGINT. SIGHUP reloads the application: workers are
+    replaced as _Master describes, a single process drains its requests and runs its
+    command again.
+
+    Args:
+      workers: number of pre-forked worker processes, 1 serves in the current process.
+      threads: number of threads handling requests in each process, by default 1, or
+               HTTP11_THREADS with http11.
+      backlog: listen backlog of the server socket.
+      reuse_port: bind a socket with SO_REUSEPORT in every worker and let the kernel
+                  balance connections among them, instead of sharing one socket.
+      http11: serve HTTP/1.1 with persistent connections and pipelining, each open
+              connection holds a thread until it is closed.
+      idle_timeout: seconds a persistent connection may wait for its next request.
+      max_requests: number of requests served on a persistent connection before it is closed.
+      max_chunked_size: with http11, request bodies sent with Transfer-Encoding: chunked
+                        larger than this many bytes are answered with 413, None for no limit.
+    '''
+    if threads is None:
+        threads = HTTP11_THREADS if http11 else 1
+    elif http11 and threads < 2:
+        logging.warning('http11 with %d thread: an idle persistent connection blocks all other clients.' % threads)
+    listen_fd = os.environ.pop(LISTEN_ENV, None)
+    listen_fd = int(listen_fd) if listen_fd is not None else None
+    fd = os.environ.pop(WORKER_ENV, None)
+    if fd is not None:
+        # a worker started by a reload of the master:
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        fd = int(fd)
+        workers = 1
+    if workers > 1 and not hasattr(os, 'fork'):
+        logging.warning('os.fork is not available, serving in one process.')
+        workers = 1
+    options = Dict(
+        workers=workers,
+        threads=threads,
+        backlog=backlog,
+        reuse_port=reuse_port,
+        http11=http11,
+        idle_timeout=idle_timeout,
+        max_requests=max_requests,
+        max_chunked_size=max_chunked_size)
+    if fd is not None:
+        server = _make_server(host, port, app, options, None if fd < 0 else fd)
+        server.multiprocess = True
+        _serve_until_signal(server)
+        os._exit(0)
+    if workers > 1:
+        if listen_fd is not None:
+            os.close(listen_fd)
+        _Master(host, port, app, workers, options).run()
+    else:
+        _serve_until_signal(_make_server(host, port, app, options, listen_fd), hasattr(signal, 'SIGHUP'))
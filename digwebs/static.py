@@ -0,0 +1,494 @@
+#!/usr/bin/env python
+
+__author__ = 'SLZ'
+
+'''
+Routes serving static files from the document root.
+'''
+
+import os, sys, stat, time, zlib, mimetypes, binascii
+from email.utils import formatdate, parsedate_to_datetime
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from .errors import notfound, HttpError
+from .common import LRUCache
+
+BLOCK_SIZE = 8192
+
+# more ranges than this in one request are ignored and the whole file is sent:
+MAX_RANGES = 16
+
+# content types other than text/* worth compressing:
+COMPRESSIBLE_TYPES = set([
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'application/wasm',
+    'image/svg+xml',
+    'image/x-icon',
+    'image/vnd.microsoft.icon',
+])
+
+# encodings of precompressed siblings, e.g. app.js.br and app.js.gz, in order of preference:
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+# ends of the ETags of bodies compressed on the fly, '"<etag>-gzip"' for '"<etag>"':
+ETAG_SUFFIXES = ('-br"', '-gzip"', '-deflate"')
+
+def _file_generator(f):
+    with f:
+        block = f.read(BLOCK_SIZE)
+        while block:
+            yield block
+            block = f.read(BLOCK_SIZE)
+
+def _range_generator(sf, ranges, heads=None, tail=b''):
+    '''
+    Yield the inclusive (start, end) ranges of the static file sf, each preceded by the matching
+    item of heads if given, then tail. Only the requested bytes are read.
+    '''
+    if sf.data is not None:
+        for i, (start, end) in enumerate(ranges):
+            if heads:
+                yield heads[i]
+            yield sf.data[start:end + 1]
+    else:
+        with open(sf.path, 'rb') as f:
+            for i, (start, end) in enumerate(ranges):
+                if heads:
+                    yield heads[i]
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    block = f.read(min(BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    remaining -= len(block)
+                    yield block
+    if tail:
+        yield tail
+
+def parse_range(value, size):
+    '''
+    Parse a Range header against a file of size bytes. Return a list of inclusive
+    (start, end) ranges, an empty list if none is satisfiable, or None if the header
+    is malformed or asks for too many ranges and should be ignored.
+
+    >>> parse_range('bytes=0-99', 1000)
+    [(0, 99)]
+    >>> parse_range('bytes=-100, 900-', 1000)
+    [(900, 999), (900, 999)]
+    >>> parse_range('bytes=500-2000', 1000)
+    [(500, 999)]
+    >>> parse_range('bytes=1000-', 1000)
+    []
+    >>> parse_range('bytes=5-1', 1000)
+    >>> parse_range('items=0-1', 1000)
+    '''
+    unit, _, spec = value.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+    ranges = []
+    for item in spec.split(','):
+        first, sep, last = item.strip().partition('-')
+        if not sep:
+            return None
+        try:
+            if first:
+                start = int(first)
+                end = int(last) if last else size - 1
+                if last and end < start:
+                    return None
+            else:
+                suffix = int(last)
+                if suffix == 0:
+                    continue
+                start = max(size - suffix, 0)
+                end = size - 1
+        except ValueError:
+            return None
+        if start < size:
+            ranges.append((start, min(end, size - 1)))
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+def _range_applies(request, etag, last_modified):
+    if_range = request.header('If-Range')
+    if not if_range:
+        return True
+    return if_range == etag or if_range == last_modified
+
+def _serve_ranges(response, sf, ranges):
+    size = sf.size
+    content_type = sf.content_type
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        response.status = 206
+        response.content_type = content_type
+        response.set_header('Content-Range', 'bytes %d-%d/%d' % (start, end, size))
+        response.content_length = end - start + 1
+        return _range_generator(sf, ranges)
+    boundary = binascii.hexlify(os.urandom(12)).decode('ascii')
+    heads = []
+    for start, end in ranges:
+        heads.append(('%s--%s\r\nContent-Type: %s\r\nContent-Range: bytes %d-%d/%d\r\n\r\n' % (
+            '\r\n' if heads else '', boundary, content_type, start, end, size)).encode('latin-1'))
+    tail = ('\r\n--%s--\r\n' % boundary).encode('latin-1')
+    response.status = 206
+    response.content_type = 'multipart/byteranges; boundary=%s' % boundary
+    response.content_length = sum(len(h) for h in heads) + len(tail) + sum(e - s + 1 for s, e in ranges)
+    return _range_generator(sf, ranges, heads, tail)
+
+def _matching_etag(etag, if_none_match):
+    '''
+    Return the tag of an If-None-Match header matching etag, weak comparison as RFC 7232
+    requires, or None. A tag with the suffix compress_response adds to the ETag of a
+    compressed body matches too and is returned as is, since it is the ETag of the
+    representation the client holds.
+
+    >>> _matching_etag('"a-1"', '"b-2", W/"a-1"')
+    '"a-1"'
+    >>> _matching_etag('"a-1"', '*')
+    '"a-1"'
+    >>> _matching_etag('"a-1"', '"a-1-gzip"')
+    '"a-1-gzip"'
+    >>> _matching_etag('"a-1"', '"a-2"')
+    '''
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag or tag == '*':
+            return etag
+        for suffix in ETAG_SUFFIXES:
+            if tag.endswith(suffix) and tag[:-len(suffix)] == etag[:-1]:
+                return tag
+    return None
+
+def _not_modified(request, etag, mtime):
+    '''
+    Return the ETag to send with a 304 if the validators of the request still hold, else None.
+    '''
+    if_none_match = request.header('If-None-Match')
+    if if_none_match is not None:
+        return _matching_etag(etag, if_none_match)
+    if_modified_since = request.header('If-Modified-Since')
+    if if_modified_since:
+        try:
+            if int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp():
+                return etag
+        except (TypeError, ValueError, IndexError):
+            pass
+    return None
+
+def negotiate_encoding(accept_encoding, available):
+    '''
+    Pick the encoding in available (in order of preference) that the Accept-Encoding header
+    allows, or None for the identity encoding.
+
+    >>> negotiate_encoding('gzip, deflate, br', ('br', 'gzip'))
+    'br'
+    >>> negotiate_encoding('br;q=0, gzip;q=0.8', ('br', 'gzip'))
+    'gzip'
+    >>> negotiate_encoding('*', ('gzip',))
+    'gzip'
+    >>> negotiate_encoding('', ('gzip',))
+    '''
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in available:
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+class _StaticFile(object):
+    '''
+    What serving a static file needs to know. variants maps an encoding to the compressed
+    content when the file is held in memory in data, or else to a precompressed sibling
+    _StaticFile.
+    '''
+
+    __slots__ = ('path', 'size', 'mtime', 'mtime_ns', 'etag', 'last_modified', 'content_type', 'data', 'variants', 'checked_at')
+
+    def __init__(self, path, st):
+        self.path = path
+        self.size = st.st_size
+        self.mtime = st.st_mtime
+        self.mtime_ns = st.st_mtime_ns
+        self.etag = '"%x-%x"' % (st.st_mtime_ns, st.st_size)
+        self.last_modified = formatdate(st.st_mtime, usegmt=True)
+        fext = os.path.splitext(path)[1]
+        self.content_type = mimetypes.types_map.get(fext.lower(), 'application/octet-stream')
+        self.data = None
+        self.variants = {}
+        self.checked_at = 0
+
+    @property
+    def weight(self):
+        return len(self.data or b'') + sum(len(v) for v in self.variants.values())
+
+def _find_siblings(sf):
+    '''
+    Return precompressed siblings of sf not older than sf by encoding.
+    '''
+    siblings = {}
+    for encoding, ext in PRECOMPRESSED:
+        try:
+            st = os.stat(sf.path + ext)
+        except OSError:
+            continue
+        if stat.S_ISREG(st.st_mode) and st.st_mtime_ns >= sf.mtime_ns:
+            sibling = _StaticFile(sf.path + ext, st)
+            sibling.content_type = sf.content_type
+            siblings[encoding] = sibling
+    return siblings
+
+def _stat_file(fpath):
+    try:
+        st = os.stat(fpath)
+    except OSError:
+        raise notfound()
+    if not stat.S_ISREG(st.st_mode):
+        raise notfound()
+    return st
+
+def is_compressible(content_type):
+    return content_type.startswith('text/') or content_type in COMPRESSIBLE_TYPES
+
+class StaticFileCache(object):
+    '''
+    Memory cache of small static files holding their bytes, Content-Type, ETag and brotli
+    and gzip variants. The variants are read from precompressed siblings when they exist,
+    otherwise compressed here (brotli only if the brotli module is installed). The least
+    recently used files are dropped when the cache holds more than max_bytes.
+
+    A cached file is served without any filesystem call, its mtime is checked again once
+    check_interval seconds have passed since the last check.
+    '''
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, max_file_size=256 * 1024, check_interval=1, compress_level=6):
+        self.max_file_size = max_file_size
+        self.check_interval = check_interval
+        self.compress_level = compress_level
+        self._files = LRUCache(maxsize=sys.maxsize, maxweight=max_bytes, weigh=lambda sf: sf.weight)
+
+    def get(self, fpath):
+        '''
+        Return the _StaticFile at fpath, in memory if it is small enough. Raise 404 if not found.
+        '''
+        now = time.monotonic()
+        sf = self._files.get(fpath)
+        if sf is not None and now - sf.checked_at < self.check_interval:
+            return sf
+        try:
+            st = _stat_file(fpath)
+        except HttpError:
+            self._files.pop(fpath)
+            raise
+        if sf is not None and sf.mtime_ns == st.st_mtime_ns and sf.size == st.st_size:
+            sf.checked_at = now
+            return sf
+        sf = _StaticFile(fpath, st)
+        if st.st_size > self.max_file_size:
+            self._files.pop(fpath)
+            return sf
+        with open(fpath, 'rb') as f:
+            sf.data = f.read()
+        sf.size = len(sf.data)
+        self._load_variants(sf)
+        sf.checked_at = now
+        self._files.set(fpath, sf)
+        return sf
+
+    def _load_variants(self, sf):
+        siblings = _find_siblings(sf)
+        compressible = is_compressible(sf.content_type)
+        for encoding, _ in PRECOMPRESSED:
+            if encoding in siblings:
+                with open(siblings[encoding].path, 'rb') as f:
+                    data = f.read()
+            elif compressible:
+                data = self._compress(encoding, sf.data)
+            else:
+                data = None
+            if data is not None and len(data) < sf.size:
+                sf.variants[encoding] = data
+
+    def _compress(self, encoding, data):
+        if encoding == 'gzip':
+            z = zlib.compressobj(self.compress_level, zlib.DEFLATED, 31)
+            return z.compress(data) + z.flush()
+        if encoding == 'br' and brotli is not None:
+            return brotli.compress(data)
+        return None
+
+class PrecompressedFiles(object):
+    '''
+    Remember which precompressed siblings static files have, so Accept-Encoding negotiation
+    does not stat them on every request. A lookup is redone when the file changes or
+    check_interval seconds have passed.
+    '''
+
+    def __init__(self, maxsize=1024, check_interval=1):
+        self.check_interval = check_interval
+        self._found = LRUCache(maxsize)
+
+    def find(self, sf):
+        now = time.monotonic()
+        found = self._found.get(sf.path)
+        if found is not None and found[1] == sf.mtime_ns and now - found[0] < self.check_interval:
+            return found[2]
+        siblings = _find_siblings(sf)
+        self._found.set(sf.path, (now, sf.mtime_ns, siblings))
+        return siblings
+
+def _serve(context, sf, cache_control):
+    request = context.request
+    response = context.response
+    response.set_header('Last-Modified', sf.last_modified)
+    response.set_header('Accept-Ranges', 'bytes')
+    if cache_control:
+        response.set_header('Cache-Control', cache_control)
+    ranges = None
+    range_header = request.header('Range')
+    if range_header and _range_applies(request, sf.etag, sf.last_modified):
+        ranges = parse_range(range_header, sf.size)
+    encoding = None
+    variant = None
+    if sf.variants or is_compressible(sf.content_type):
+        response.set_header('Vary', 'Accept-Encoding')
+    if sf.variants and ranges is None:
+        encoding = negotiate_encoding(request.header('Accept-Encoding'), sf.variants)
+    if encoding is None:
+        etag = sf.etag
+    else:
+        variant = sf.variants[encoding]
+        if isinstance(variant, bytes):
+            etag = '%s-%s"' % (sf.etag[:-1], encoding)
+        else:
+            etag = variant.etag
+    response.set_header('ETag', etag)
+    not_modified_etag = _not_modified(request, etag, sf.mtime)
+    if not_modified_etag:
+        # a tag with an encoding suffix is that of the body compress_response compressed:
+        response.set_header('ETag', not_modified_etag)
+        response.status = 304
+        response.content_type = None
+        return []
+    if ranges == []:
+        response.set_header('Content-Range', 'bytes */%d' % sf.size)
+        raise HttpError(416)
+    if ranges:
+        return _serve_ranges(response, sf, ranges)
+    response.content_type = sf.content_type
+    if encoding is not None:
+        response.set_header('Content-Encoding', encoding)
+        if isinstance(variant, bytes):
+            response.content_length = len(variant)
+            return [variant]
+        sf = variant
+    response.content_length = sf.size
+    if sf.data is not None:
+        return [sf.data]
+    f = open(sf.path, 'rb')
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if file_wrapper:
+        return file_wrapper(f, BLOCK_SIZE)
+    return _file_generator(f)
+
+def serve_file(context, fpath, cache_control=None, cache=None, precompressed=None):
+    '''
+    Return the file at fpath as response body with Content-Type, Content-Length, ETag,
+    Last-Modified and the optional Cache-Control set, or an empty body with status 304 if
+    the If-None-Match or If-Modified-Since validators of the request still hold.
+
+    A Range header is answered by 206 with the requested slice, by multipart/byteranges
+    for several ranges, or by 416 if no range is satisfiable.
+
+    Small files are served from cache (a StaticFileCache) if given, with a compressed variant
+    chosen by Accept-Encoding. Other files are served from their precompressed .br or .gz
+    sibling if the client accepts it and precompressed (a PrecompressedFiles) is given, and
+    wrapped by wsgi.file_wrapper when the server
+    provides one, so the server can send them by os.sendfile, otherwise they are read in blocks.
+    '''
+    if cache is not None:
+        sf = cache.get(fpath)
+    else:
+        sf = _StaticFile(fpath, _stat_file(fpath))
+    if sf.data is None and precompressed is not None:
+        sf.variants = precompressed.find(sf)
+    return _serve(context, sf, cache_control)
+
+class StaticFileRoute(object):
+    def __init__(self, cache_control=None, cache=None):
+        '''
+        Init a StaticFileRoute.
+
+        Args:
+          cache_control: dict of url prefix under /static/ to max-age in seconds, or to a
+                         Cache-Control value as str. The longest matching prefix is used.
+          cache: optional StaticFileCache holding small files in memory.
+        '''
+        self.method = 'GET'
+        self.is_static = False
+        self.cache = cache
+        self.precompressed = PrecompressedFiles()
+        self.cache_control = []
+        for prefix, value in (cache_control or {}).items():
+            if isinstance(value, int):
+                value = 'max-age=%d' % value
+            self.cache_control.append((prefix, value))
+        self.cache_control.sort(key=lambda item: len(item[0]), reverse=True)
+
+    def get_cache_control(self, url):
+        '''
+        >>> r = StaticFileRoute({'/static/': 60, '/static/js/': 'public, max-age=31536000'})
+        >>> r.get_cache_control('/static/js/app.js')
+        'public, max-age=31536000'
+        >>> r.get_cache_control('/static/a.css')
+        'max-age=60'
+        '''
+        for prefix, value in self.cache_control:
+            if url.startswith(prefix):
+                return value
+        return None
+
+    def match(self, url):
+        if url.startswith('/static/'):
+            return (url[1:], )
+        return None
+
+    def __call__(self, context, *args):
+        fpath = os.path.join(context.application.document_root, args[0])
+        return serve_file(context, fpath, self.get_cache_control('/' + args[0]), self.cache, self.precompressed)
+
+class FaviconFileRoute(object):
+
+    def __init__(self, cache=None):
+        self.method = 'GET'
+        self.is_static = False
+        self.cache = cache
+
+    def match(self, url):
+        if url == '/favicon.ico':
+            return ('favicon.ico', )
+        return None
+
+    def __call__(self, context, *args):
+        return serve_file(context, os.path.join(context.application.document_root, args[0]), cache=self.cache)
@@ -2,8 +2,16 @@
 
 __author__ = 'SLZ'
 
+import os
+import hashlib
+import logging
+
 
 class Template(object):
+
+    # 0 renders the whole page at once, otherwise it is streamed in chunks of about this many bytes:
+    chunk_size = 0
+
     def __init__(self, template_name, **kw):
         '''
         Init a template object with template name, model as dict, and additional kw that will append to model.
@@ -29,6 +37,13 @@ class TemplateEngine(object):
     def __call__(self, path, model):
         return '<!-- override this method to render template -->'
 
+    def stream(self, path, model, chunk_size=8192):
+        '''
+        Return an iterable of the rendered page in bytes chunks of about chunk_size.
+        '''
+        r = self(path, model)
+        return [r.encode('utf-8') if isinstance(r, str) else r]
+
 
 class Jinja2TemplateEngine(TemplateEngine):
     '''
@@ -41,10 +56,22 @@ class Jinja2TemplateEngine(TemplateEngine):
     '<p>Hello, Michael.</p><span>2014-06-01 10:11:12</span>'
     '''
 
-    def __init__(self, templ_dir, **kw):
-        from jinja2 import Environment, FileSystemLoader
+    def __init__(self, templ_dir, bytecode_cache_dir=None, **kw):
+        '''
+        Init a Jinja2TemplateEngine.
+
+        Args:
+          templ_dir: directory of the templates.
+          bytecode_cache_dir: directory to store compiled templates in, so other processes
+                              and later runs load them instead of compiling the sources.
+        '''
+        from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
         if not 'autoescape' in kw:
             kw['autoescape'] = True
+        if bytecode_cache_dir and not 'bytecode_cache' in kw:
+            if not os.path.isdir(bytecode_cache_dir):
+                os.makedirs(bytecode_cache_dir)
+            kw['bytecode_cache'] = _bytecode_cache(FileSystemBytecodeCache, bytecode_cache_dir)
         self._env = Environment(
             variable_start_string='{{{{',
             variable_end_string='}}}}',
@@ -59,10 +86,61 @@ class Jinja2TemplateEngine(TemplateEngine):
     
     def get_globals(self,key):
         return self._env.globals.get(key)
+
+    def precompile(self):
+        '''
+        Load every template so that it is compiled now, and written to the bytecode cache if
+        there is one. Templates failing to compile, e.g. by using filters not added yet, are
+        logged and left to be compiled when first rendered. Return the number compiled.
+        '''
+        from jinja2 import TemplateError
+        count = 0
+        for name in self._env.list_templates(filter_func=lambda n: not os.path.basename(n).startswith('.')):
+            try:
+                self._env.get_template(name)
+                count += 1
+            except TemplateError as e:
+                logging.warning('Can not precompile template %s: %s' % (name, e))
+        return count
     
     def __call__(self, path, model):
         return self._env.get_template(path).render(**model).encode('utf-8')
 
+    def stream(self, path, model, chunk_size=8192):
+        '''
+        Render by Jinja2's generate(), yielding the page in bytes chunks of at least chunk_size
+        except the last, so the first bytes can be sent before the whole page is rendered.
+        The template is loaded before returning, so a missing template raises at once.
+        '''
+        return _buffered(self._env.get_template(path).generate(**model), chunk_size)
+
+def _bytecode_cache(base, directory):
+    '''
+    Return a jinja2 FileSystemBytecodeCache in directory keyed by the template name, which is
+    relative to the template folder, instead of the absolute path of the template, so a cache
+    built in one directory is reused when the application is deployed to another. Each entry
+    still holds the checksum of its source, so changed templates are compiled again.
+    '''
+    class NameKeyedBytecodeCache(base):
+        def get_cache_key(self, name, filename=None):
+            return hashlib.sha1(name.encode('utf-8')).hexdigest()
+
+    return NameKeyedBytecodeCache(directory)
+
+def _buffered(fragments, chunk_size):
+    buf = []
+    size = 0
+    for s in fragments:
+        b = s.encode('utf-8')
+        buf.append(b)
+        size += len(b)
+        if size >= chunk_size:
+            yield b''.join(buf)
+            buf = []
+            size = 0
+    if buf:
+        yield b''.join(buf)
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
\ No newline at end of file
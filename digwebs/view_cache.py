@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+__author__ = 'SLZ'
+
+'''
+Memory cache of rendered pages, see digwebs.cached_view.
+'''
+
+import sys
+import time
+import asyncio
+import threading
+
+from .common import LRUCache
+
+class ViewCache(object):
+    '''
+    Cache of rendered (body, content_type, ...) by key, each expiring after its own ttl. The least
+    recently used pages are dropped when the bodies add up to more than max_bytes.
+
+    When a page is missing, the first request renders it while concurrent requests for the
+    same key wait for its result instead of rendering it too.
+
+    >>> c = ViewCache(100)
+    >>> calls = []
+    >>> def render():
+    ...     calls.append(1)
+    ...     return b'page', 'text/html'
+    >>> c.get_or_render('k', 60, render)
+    (b'page', 'text/html')
+    >>> c.get_or_render('k', 60, render)
+    (b'page', 'text/html')
+    >>> len(calls)
+    1
+    >>> c.get_or_render('k2', 0, render) and c.get_or_render('k2', 0, render) and len(calls)
+    3
+    '''
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self._pages = LRUCache(maxsize=sys.maxsize, maxweight=max_bytes, weigh=lambda e: len(e[1][0]))
+        self._lock = threading.Lock()
+        self._rendering = {}
+        self._arendering = {}
+
+    def get(self, key):
+        '''
+        Return the (body, content_type) cached for key, or None if missing or expired.
+        '''
+        entry = self._pages.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._pages.pop(key)
+            return None
+        return entry[1]
+
+    def set(self, key, value, ttl):
+        if ttl > 0:
+            self._pages.set(key, (time.monotonic() + ttl, value))
+
+    def clear(self):
+        self._pages.clear()
+
+    def get_or_render(self, key, ttl, render):
+        '''
+        Return the page cached for key, or cache and return render(). Requests waiting for
+        a render get its page, or if it raised, one of them renders again.
+        '''
+        while True:
+            value = self.get(key)
+            if value is not None:
+                return value
+            with self._lock:
+                rendering = self._rendering.get(key)
+                if rendering is None:
+                    rendering = self._rendering[key] = _Rendering(threading.Event())
+                    break
+            rendering.event.wait()
+            if rendering.value is not None:
+                return rendering.value
+        try:
+            rendering.value = render()
+            self.set(key, rendering.value, ttl)
+            return rendering.value
+        finally:
+            with self._lock:
+                del self._rendering[key]
+            rendering.event.set()
+
+    async def aget_or_render(self, key, ttl, render):
+        '''
+        The same as get_or_render for an event loop, render() returns an awaitable.
+        '''
+        while True:
+            value = self.get(key)
+            if value is not None:
+                return value
+            rendering = self._arendering.get(key)
+            if rendering is None:
+                break
+            await rendering.event.wait()
+            if rendering.value is not None:
+                return rendering.value
+        rendering = self._arendering[key] = _Rendering(asyncio.Event())
+        try:
+            rendering.value = await render()
+            self.set(key, rendering.value, ttl)
+            return rendering.value
+        finally:
+            del self._arendering[key]
+            rendering.event.set()
+
+class _Rendering(object):
+    '''
+    A render in progress, value is its page once it succeeded.
+    '''
+    __slots__ = ('event', 'value')
+
+    def __init__(self, event):
+        self.event = event
+        self.value = None
+
+if __name__=='__main__':
+    import doctest
+    doctest.testmod()
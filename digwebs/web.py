@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 '''
-A simple, lightweight, WSGI-compatible web framework.
+A simple, lightweight, WSGI and ASGI compatible web framework.
 '''
 
 __author__ = 'SLZ'
@@ -16,6 +16,8 @@ import traceback
 import hashlib
 import functools
 import json
+import inspect
+import contextvars
 from io import StringIO
 
 # import custom modules
@@ -26,9 +28,13 @@ from .response import Response
 from .template import Template, Jinja2TemplateEngine
 from .router import Router
 from .apis import APIError
+from .context import RequestContext
+from .compress import compress_response
+from .view_cache import ViewCache
+from . import asgi
 
-# thread local object for storing request and response:
-ctx = threading.local()
+# context object for storing request and response, each thread or asyncio task has its own:
+ctx = RequestContext()
 
 class digwebs(object):
     def __init__(
@@ -37,12 +43,37 @@ class digwebs(object):
         template_folder = 'views',
         middlewares_folder= 'middlewares',
         controller_folder = 'controllers',
-        is_develop_mode = True):
+        is_develop_mode = True,
+        serve_static = None,
+        route_engine = 'trie',
+        route_cache_size = 1024,
+        notfound_cache_size = 256,
+        static_cache_control = None,
+        static_memory_cache = 0,
+        compress = False,
+        compress_level = 6,
+        compress_min_size = 1024,
+        template_bytecode_cache = None,
+        template_cache_size = 400,
+        view_cache_size = 32 * 1024 * 1024):
         '''
         Init a digwebs.
 
         Args:
           root_path: root path.
+          is_develop_mode: check templates for changes on each use.
+          serve_static: serve /static/ and /favicon.ico, by default only if is_develop_mode.
+          route_engine: 'trie', 'regex' or 'list', see Router.
+          route_cache_size: max number of resolved dynamic routes to remember, see Router.
+          notfound_cache_size: max number of unresolved urls to remember, see Router.
+          static_cache_control: dict of url prefix under /static/ to max-age, see StaticFileRoute.
+          static_memory_cache: bytes of small static files to hold in memory, 0 to disable.
+          compress: gzip or deflate responses the client accepts compressed, see compress_response.
+          compress_level: zlib compression level from 1 (fastest) to 9 (smallest).
+          compress_min_size: responses smaller than this many bytes are not compressed.
+          template_bytecode_cache: folder under root_path to store compiled templates in.
+          template_cache_size: max number of compiled templates kept in memory, -1 for no limit.
+          view_cache_size: max bytes of pages cached by cached_view.
         '''
 
         self.root_path = root_path if root_path else os.path.abspath(os.path.dirname(sys.argv[0]))
@@ -51,17 +82,51 @@ class digwebs(object):
         self.middlewares_folder = middlewares_folder
         self.controller_folder = controller_folder
         self.is_develop_mode = is_develop_mode
-        self.template_callbacks = set()
+        self.serve_static = is_develop_mode if serve_static is None else serve_static
+        self.route_engine = route_engine
+        self.route_cache_size = route_cache_size
+        self.notfound_cache_size = notfound_cache_size
+        self.static_cache_control = static_cache_control
+        self.static_memory_cache = static_memory_cache
+        self.compress = compress
+        self.compress_level = compress_level
+        self.compress_min_size = compress_min_size
+        self.template_bytecode_cache = template_bytecode_cache
+        self.template_cache_size = template_cache_size
+        self.view_cache = ViewCache(view_cache_size)
+        self.template_callbacks = []
         self.router = None
     
-    def init_all(self):
+    def init_all(self, precompile_templates=False):
+        '''
+        Load the template engine, controllers and middlewares. With precompile_templates=True
+        every template is compiled now instead of on its first request.
+        '''
         if self.template_folder:
             self._init_template_engine(os.path.join(self.root_path, self.template_folder))
         
-        self.router = Router(self.is_develop_mode)
+        self.router = Router(
+            self.serve_static,
+            self.route_engine,
+            self.route_cache_size,
+            self.notfound_cache_size,
+            self.static_cache_control,
+            self.static_memory_cache)
         self.middleware.append(self.router.create_controller(self.root_path,self.controller_folder,))
         if self.middlewares_folder:
             self._init_middlewares(os.path.join(self.root_path, self.middlewares_folder))
+        if precompile_templates:
+            self.precompile_templates()
+
+    def precompile_templates(self):
+        '''
+        Compile every template under template_folder, return the number compiled.
+        '''
+        if not self.template_folder:
+            return 0
+        count = self.template_engine.precompile()
+        logging.info('Precompiled %d templates' % count)
+        return count
 
     def _init_template_engine(self,template_path):
         def datetime_filter(t):
@@ -77,7 +142,14 @@ class digwebs(object):
             dt = datetime.datetime.fromtimestamp(t)
             return u'%s年%s月%s日' % (dt.year, dt.month, dt.day)
 
-        self.template_engine = Jinja2TemplateEngine(template_path)
+        bytecode_cache_dir = None
+        if self.template_bytecode_cache:
+            bytecode_cache_dir = os.path.join(self.root_path, self.template_bytecode_cache)
+        self.template_engine = Jinja2TemplateEngine(
+            template_path,
+            bytecode_cache_dir,
+            auto_reload=self.is_develop_mode,
+            cache_size=self.template_cache_size)
         self.template_engine.add_filter('datetime', datetime_filter)
 
     def _init_middlewares(self,middlewares_path):
@@ -97,89 +169,217 @@ class digwebs(object):
 
         self.middleware.sort(key=take_second)
 
-    def run(self, port=9999, host='127.0.0.1'):
-        from wsgiref.simple_server import make_server
+    def run(self, port=9999, host='127.0.0.1', workers=1, threads=None, backlog=128, reuse_port=False, http11=False, idle_timeout=5, max_requests=100, max_chunked_size=16 * 1024 * 1024):
+        '''
+        Serve the application by the built-in server until SIGTERM or SIGINT, which stop
+        accepting and finish the requests in flight. With workers > 1, SIGHUP replaces the workers
+        by new ones running the command of the master again, so they load the current code.
+
+        Args:
+          workers: number of pre-forked worker processes.
+          threads: number of threads handling requests in each worker, by default 1, or
+                   HTTP11_THREADS of digwebs.server with http11.
+          backlog: listen backlog of the server socket.
+          reuse_port: let each worker bind its own socket with SO_REUSEPORT.
+          http11: serve HTTP/1.1 with persistent connections and pipelining.
+          idle_timeout: seconds a persistent connection may wait for its next request.
+          max_requests: number of requests served on a persistent connection before closing it.
+          max_chunked_size: with http11, chunked request bodies larger than this are refused with 413.
+        '''
+        from .server import serve
         logging.info('application (%s) will start at %s:%s...' %
                      (self.root_path, host, port))
-        server = make_server(host, port, self.get_wsgi_application())
-        server.serve_forever()
+        serve(
+            self.get_wsgi_application(), host, port, workers, threads, backlog, reuse_port,
+            http11, idle_timeout, max_requests, max_chunked_size)
 
-    def get_wsgi_application(self):
-        _application = Dict(document_root=self.root_path)
-
-        def fn_route():
-            def route_entry(context, next):
-                def dispatch(i):
-                    fn = self.middleware[i][0]
-                    if i == len(self.middleware):
-                        fn = next
-                    return fn(context, lambda: dispatch(i + 1))
+    def _build_pipeline(self):
+        '''
+        Chain the middlewares (sorted by priority) once, each next() is prebound to ctx and
+        the middleware after it, so dispatching a request allocates nothing for the chain.
+        Calling next() from the last middleware raises 404.
+        '''
+        def end():
+            raise notfound()
 
-                return dispatch(0)
+        chain = end
+        for fn, _ in reversed(self.middleware):
+            chain = functools.partial(fn, ctx, chain)
+        return chain
 
-            return route_entry
+    def _build_async_pipeline(self):
+        '''
+        The same as _build_pipeline, but each next() returns an awaitable and middlewares may be
+        async def. A plain middleware can still return next(), the result is awaited for it.
+        '''
+        async def end():
+            raise notfound()
+
+        chain = end
+        for fn, _ in reversed(self.middleware):
+            if inspect.iscoroutinefunction(fn):
+                chain = functools.partial(_call_async, fn, ctx, chain)
+            else:
+                chain = functools.partial(_call_plain, fn, ctx, chain)
+        return chain
+
+    def _render_result(self, r):
+        '''
+        Convert the value returned by the middlewares into an iterable of bytes.
+        '''
+        if isinstance(r, Template):
+            if r.chunk_size:
+                return self._render_template(r)
+            return [self._render_template(r)]
+        if isinstance(r, str):
+            tmp = []
+            tmp.append(r.encode('utf-8'))
+            r = tmp
+        if r is None:
+            r = []
+        return r
+
+    def _render_template(self, t):
+        '''
+        Render the Template t with the template callbacks and ctx added to its model, return
+        bytes, or an iterable of bytes chunks if t is to be streamed.
+        '''
+        if self.template_callbacks:
+            try:
+                values = ctx.template_values
+            except AttributeError:
+                values = ctx.template_values = {}
+            for cb in self.template_callbacks:
+                t.model.update(cb.value(values))
+        t.model['ctx'] = ctx
+        if t.chunk_size:
+            return _stream_in_context(self.template_engine.stream(t.template_name, t.model, t.chunk_size))
+        return self.template_engine(t.template_name, t.model)
+
+    def _finish_response(self, env, response, r):
+        '''
+        Return (status, headers, body) of response with body r, see _finish_body. The body is
+        compressed if compress is set, HEAD requests get the headers of GET and no body.
+
+        >>> app = digwebs(root_path=os.getcwd(), template_folder=None, middlewares_folder=None)
+        >>> full = app._finish_response({'REQUEST_METHOD': 'GET'}, Response(), [b'hello'])
+        >>> head = app._finish_response({'REQUEST_METHOD': 'HEAD'}, Response(), [b'hello'])
+        >>> ('Content-Length', '5') in full[1], head[:2] == full[:2]
+        (True, True)
+        >>> full[2], head[2]
+        ([b'hello'], [])
+        '''
+        r = _finish_body(response, r)
+        status, headers = response.status, response.headers
+        if self.compress:
+            headers, r = compress_response(
+                env.get('HTTP_ACCEPT_ENCODING'), env.get('REQUEST_METHOD'), status, headers, r,
+                self.compress_level, self.compress_min_size)
+        if env.get('REQUEST_METHOD') == 'HEAD':
+            if hasattr(r, 'close'):
+                r.close()
+            return status, headers, []
+        return status, headers, r
 
-        fn_exec = fn_route()
+    def get_wsgi_application(self):
+        _application = Dict(document_root=self.root_path)
+        fn_exec = self._build_pipeline()
 
         def wsgi(env, start_response):
-            ctx.application = _application
-            ctx.request = Request(env)
-            response = ctx.response = Response()
+            token = ctx.bind(application=_application, request=Request(env), response=Response())
+            response = ctx.response
+            method = env.get('REQUEST_METHOD')
             try:
-                r = fn_exec(ctx, None)
-                if isinstance(r, Template):
-                    tmp = []
-                    for cbf in self.template_callbacks:
-                        r.model.update(cbf())
-                    r.model['ctx'] = ctx
-                    tmp.append(self.template_engine(r.template_name, r.model))
-                    r = tmp
-                if isinstance(r, str):
-                    tmp = []
-                    tmp.append(r.encode('utf-8'))
-                    r = tmp
-                if r is None:
-                    r = []
-                start_response(response.status, response.headers)
+                r = fn_exec()
+                if inspect.iscoroutine(r):
+                    r.close()
+                    raise TypeError('async controllers and middlewares need the ASGI application, see get_asgi_application()')
+                status, headers, r = self._finish_response(env, response, self._render_result(r))
+                start_response(status, headers)
                 return r
-            except RedirectError as e:
-                response.set_header('Location', e.location)
-                start_response(e.status, response.headers)
-                return []
-            except HttpError as e:
-                start_response(e.status, response.headers)
-                return ['<html><body><h1>', e.status, '</h1></body></html>']
             except Exception as e:
-                logging.exception(e)
-                '''
-                if not configs.get('debug',False):
-                    start_response('500 Internal Server Error', [])
-                    return ['<html><body><h1>500 Internal Server Error</h1></body></html>']
-                '''
-                exc_type, exc_value, exc_traceback = sys.exc_info()
-                fp = StringIO()
-                traceback.print_exception(
-                    exc_type, exc_value, exc_traceback, file=fp)
-                stacks = fp.getvalue()
-                fp.close()
-                start_response('500 Internal Server Error', [])
-                return [
-                    r'''<html><body><h1>500 Internal Server Error</h1><div style="font-family:Monaco, Menlo, Consolas, 'Courier New', monospace;"><pre>''',
-                    stacks.replace('<', '&lt;').replace('>', '&gt;'),
-                    '</pre></div></body></html>'
-                ]
+                status, headers, r = _error_response(e, response)
+                start_response(status, headers)
+                return [] if method == 'HEAD' else r
             finally:
-                del ctx.application
-                del ctx.request
-                del ctx.response
+                ctx.reset(token)
 
         return wsgi
 
-    def register_template_callback(self,cb):
-        self.template_callbacks.add(cb)
-    
+    def get_asgi_application(self):
+        '''
+        Return an ASGI application which serves the same routes and middlewares as
+        get_wsgi_application, controllers and middlewares may be async def.
+
+        Plain controllers still run in the event loop, so keep blocking work in async code.
+        In a plain middleware next() returns an awaitable, so it can only return next()
+        unchanged: one returning anything else after calling next() raises TypeError, and
+        errors of later middlewares and controllers are not raised inside it. Make
+        middlewares that handle the result or the errors of next() async def.
+        Request bodies are spooled to a temporary file past Request.spool_size bytes and
+        answered with 413 past Request.max_body_size bytes.
+        '''
+        _application = Dict(document_root=self.root_path)
+        fn_exec = self._build_async_pipeline()
+
+        async def app(scope, receive, send):
+            if scope['type'] == 'lifespan':
+                await asgi.lifespan(receive, send)
+                return
+            if scope['type'] != 'http':
+                raise ValueError('Unsupported ASGI scope type: %s' % scope['type'])
+            env = asgi.make_environ(scope)
+            token = ctx.bind(
+                application=_application,
+                request=Request(env),
+                response=Response())
+            response = ctx.response
+            method = env['REQUEST_METHOD']
+            try:
+                env['wsgi.input'] = await asgi.read_body(receive, Request.max_body_size, Request.spool_size)
+                status, headers, r = self._finish_response(env, response, self._render_result(await fn_exec()))
+            except Exception as e:
+                status, headers, r = _error_response(e, response)
+                if method == 'HEAD':
+                    r = []
+            finally:
+                ctx.reset(token)
+            try:
+                await asgi.send_response(send, status, headers, r)
+            finally:
+                env['wsgi.input'].close()
+
+        return app
+
+    def register_template_callback(self, cb, ttl=None, scope='request'):
+        '''
+        Register cb, which returns a dict merged into the model of every rendered template.
+        Callbacks run in the order they were registered, registering cb again updates its options.
+
+        Args:
+          scope: 'request' calls cb once per request, however many templates it renders.
+                 'process' shares the result of cb between requests.
+          ttl: seconds after which a 'process' result is computed again, None for never.
+        '''
+        for c in self.template_callbacks:
+            if c.fn is cb:
+                c.configure(ttl, scope)
+                return
+        self.template_callbacks.append(_TemplateCallback(cb, ttl, scope))
+
     def unregister_template_callback(self,cb):
-        self.template_callbacks.remove(cb)
+        for c in self.template_callbacks:
+            if c.fn is cb:
+                self.template_callbacks.remove(c)
+                return
+        raise KeyError(cb)
+
+    def template_callback_stats(self):
+        '''
+        Return a Dict per template callback, in order, with the number of calls, results served
+        from cache, and total and max time spent in the callback in milliseconds.
+        '''
+        return [c.stats() for c in self.template_callbacks]
     
     @property
     def static_resource_url(self):
@@ -263,10 +463,13 @@ class digwebs(object):
 
         return _decorator
 
-    def view(self, path):
+    def view(self, path, stream=False, chunk_size=8192):
         '''
         A view decorator that render a view by dict.
 
+        With stream=True the page is sent while it is rendered, in chunks of about chunk_size
+        bytes, instead of after the whole page is rendered.
+
         >>> @view('test/view.html')
         ... def hello():
         ...     return dict(name='Bob')
@@ -282,31 +485,90 @@ class digwebs(object):
         Traceback (most recent call last):
         ...
         ValueError: Expect return a dict when using @view() decorator.
+        >>> @view('test/view.html', stream=True, chunk_size=1024)
+        ... def hello3():
+        ...     return dict(name='Bob')
+        >>> hello3().chunk_size
+        1024
         '''
+        chunk_size = chunk_size if stream else 0
 
         def _decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def _async_wrapper(*args, **kw):
+                    return _to_template(path, await func(*args, **kw), chunk_size)
+
+                return _async_wrapper
+
             @functools.wraps(func)
             def _wrapper(*args, **kw):
-                r = func(*args, **kw)
-                if isinstance(r, dict):
-                    logging.info('return Template')
-                    return Template(path, **r)
-                raise ValueError(
-                    'Expect return a dict when using @view() decorator.')
+                return _to_template(path, func(*args, **kw), chunk_size)
 
             return _wrapper
 
         return _decorator
     
-    def dynamic_view(self, pathfn):
+    def cached_view(self, path, ttl=60, query=(), key_func=None):
+        '''
+        A view decorator like view(path) which caches the rendered page for ttl seconds, keyed
+        by the request path, the values of the query parameters named in query and the value
+        of key_func() if given, e.g. the language of the user. While a page is rendered,
+        concurrent requests for it wait and share the result.
+
+        Only the status, body and Content-Type are cached, other headers set by func are not
+        replayed.
+
+        @cached_view('blog.html', ttl=300, query=('page',))
+        def blog():
+            return dict(blogs=load_blogs())
+        '''
+        def _key():
+            request = ctx.request
+            params = request.get_query_string(to_json=True) if query else {}
+            return (
+                path,
+                request.path_info,
+                tuple(tuple(params.get(name, ())) for name in query),
+                key_func() if key_func else None)
+
+        def _result(page):
+            ctx.response.status = page[2]
+            ctx.response.content_type = page[1]
+            return [page[0]]
+
         def _decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def _async_wrapper(*args, **kw):
+                    async def render():
+                        t = _to_template(path, await func(*args, **kw))
+                        return self._render_template(t), ctx.response.content_type, ctx.response.status_code
+                    return _result(await self.view_cache.aget_or_render(_key(), ttl, render))
+                return _async_wrapper
+
             @functools.wraps(func)
             def _wrapper(*args, **kw):
-                r = func(*args, **kw)
-                if isinstance(r, dict):
-                    logging.info('return Template')
-                    return Template(pathfn(), **r)
-                raise ValueError('Expect return a dict when using @view() decorator.')
+                def render():
+                    t = _to_template(path, func(*args, **kw))
+                    return self._render_template(t), ctx.response.content_type, ctx.response.status_code
+                return _result(self.view_cache.get_or_render(_key(), ttl, render))
+            return _wrapper
+        return _decorator
+
+    def dynamic_view(self, pathfn, stream=False, chunk_size=8192):
+        chunk_size = chunk_size if stream else 0
+
+        def _decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def _async_wrapper(*args, **kw):
+                    return _to_template(pathfn(), await func(*args, **kw), chunk_size)
+                return _async_wrapper
+
+            @functools.wraps(func)
+            def _wrapper(*args, **kw):
+                return _to_template(pathfn(), func(*args, **kw), chunk_size)
             return _wrapper
         return _decorator
 
@@ -319,19 +581,214 @@ class digwebs(object):
         def api_test():
             return dict(result='123', items=[])
         '''
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def _async_wrapper(*args, **kw):
+                try:
+                    r = json.dumps(await func(*args, **kw))
+                except Exception as e:
+                    r = _api_error(e)
+                ctx.response.content_type = 'application/json'
+                return r
+            return _async_wrapper
+
         @functools.wraps(func)
         def _wrapper(*args, **kw):
             try:
                 r = json.dumps(func(*args, **kw))
-            except APIError as e:
-                r = json.dumps(dict(error=e.error, data=e.data, message=e.message))
             except Exception as e:
-                logging.exception(e)
-                r = json.dumps(dict(error='internalerror', data=e.__class__.__name__, message=str(e)))
+                r = _api_error(e)
             ctx.response.content_type = 'application/json'
             return r
         return _wrapper
 
+class _TemplateCallback(object):
+    '''
+    A registered template callback with its cached result and timing.
+
+    >>> calls = []
+    >>> c = _TemplateCallback(lambda: calls.append(1) or dict(menu=len(calls)), None, 'process')
+    >>> c.value({}), c.value({})
+    ({'menu': 1}, {'menu': 1})
+    >>> c.configure(None, 'request')
+    >>> values = {}
+    >>> c.value(values), c.value(values), c.value({})
+    ({'menu': 2}, {'menu': 2}, {'menu': 3})
+    >>> c.stats().calls, c.stats().hits
+    (3, 2)
+    '''
+
+    def __init__(self, fn, ttl=None, scope='request'):
+        self.fn = fn
+        self.calls = 0
+        self.hits = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self._lock = threading.Lock()
+        self.configure(ttl, scope)
+
+    def configure(self, ttl, scope):
+        if scope not in ('request', 'process'):
+            raise ValueError('Unknown template callback scope: %s' % scope)
+        self.ttl = ttl
+        self.scope = scope
+        self._value = None
+        self._expires = 0
+
+    def _call(self):
+        start = time.perf_counter()
+        value = self.fn()
+        elapsed = time.perf_counter() - start
+        self.calls += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        return value
+
+    def value(self, values):
+        '''
+        Return the result of fn for the current request, whose results so far are in values.
+        '''
+        if self.scope == 'request':
+            if self in values:
+                self.hits += 1
+                return values[self]
+            value = values[self] = self._call()
+            return value
+        with self._lock:
+            if self._value is not None and time.monotonic() < self._expires:
+                self.hits += 1
+                return self._value
+            self._value = self._call()
+            self._expires = float('inf') if self.ttl is None else time.monotonic() + self.ttl
+            return self._value
+
+    def stats(self):
+        return Dict(
+            name=getattr(self.fn, '__name__', repr(self.fn)),
+            scope=self.scope,
+            ttl=self.ttl,
+            calls=self.calls,
+            hits=self.hits,
+            total_ms=self.total_time * 1000,
+            max_ms=self.max_time * 1000)
+
+async def _call_async(fn, context, next):
+    r = fn(context, next)
+    while inspect.isawaitable(r):
+        r = await r
+    return r
+
+async def _call_plain(fn, context, next):
+    '''
+    Call the plain middleware fn, which may only return the awaitable of next() unchanged.
+    '''
+    called = []
+
+    def _next():
+        r = next()
+        called.append(r)
+        return r
+
+    r = fn(context, _next)
+    if called and r is not called[-1]:
+        for c in called:
+            c.close()
+        raise TypeError(
+            'Middleware %s uses the result of next(), which is an awaitable in the ASGI application: make it async def.'
+            % getattr(fn, '__qualname__', fn))
+    while inspect.isawaitable(r):
+        r = await r
+    return r
+
+def _to_template(path, r, chunk_size=0):
+    if isinstance(r, dict):
+        logging.info('return Template')
+        t = Template(path, **r)
+        t.chunk_size = chunk_size
+        return t
+    raise ValueError('Expect return a dict when using @view() decorator.')
+
+def _api_error(e):
+    if isinstance(e, APIError):
+        return json.dumps(dict(error=e.error, data=e.data, message=e.message))
+    logging.exception(e)
+    return json.dumps(dict(error='internalerror', data=e.__class__.__name__, message=str(e)))
+
+def _stream_in_context(chunks):
+    '''
+    Iterate chunks in a copy of the current context, so that rendering still sees ctx bound
+    to its request when the server iterates the body after wsgi() returned.
+    '''
+    return _run_in_context(contextvars.copy_context(), iter(chunks))
+
+def _run_in_context(context, it):
+    try:
+        while True:
+            try:
+                chunk = context.run(next, it)
+            except StopIteration:
+                return
+            yield chunk
+    finally:
+        if hasattr(it, 'close'):
+            context.run(it.close)
+
+def _finish_body(response, r):
+    '''
+    Set Content-Length when the whole body is at hand as a list of bytes, so the server need
+    not fall back to chunked encoding or closing the connection.
+
+    >>> response = Response()
+    >>> _finish_body(response, [b'hello', b' world'])
+    [b'hello', b' world']
+    >>> response.content_length
+    '11'
+    >>> response = Response()
+    >>> _finish_body(response, iter([b'hello'])) is not None, response.content_length
+    (True, None)
+    >>> response.status = 304
+    >>> _finish_body(response, []), response.content_length
+    ([], None)
+    '''
+    if isinstance(r, list) and response.content_length is None and response.status_code not in (204, 304):
+        size = 0
+        for chunk in r:
+            if not isinstance(chunk, bytes):
+                break
+            size += len(chunk)
+        else:
+            response.content_length = size
+    return r
+
+def _error_response(e, response):
+    '''
+    Return (status, headers, body) for an exception raised while handling a request.
+    '''
+    if isinstance(e, RedirectError):
+        response.set_header('Location', e.location)
+        return e.status, response.headers, []
+    if isinstance(e, HttpError):
+        body = ('<html><body><h1>%s</h1></body></html>' % e.status).encode('utf-8')
+        response.content_length = len(body)
+        return e.status, response.headers, [body]
+    logging.exception(e)
+    '''
+    if not configs.get('debug',False):
+        start_response('500 Internal Server Error', [])
+        return ['<html><body><h1>500 Internal Server Error</h1></body></html>']
+    '''
+    exc_type, exc_value, exc_traceback = sys.exc_info()
+    fp = StringIO()
+    traceback.print_exception(
+        exc_type, exc_value, exc_traceback, file=fp)
+    stacks = fp.getvalue()
+    fp.close()
+    return '500 Internal Server Error', [], [
+        r'''<html><body><h1>500 Internal Server Error</h1><div style="font-family:Monaco, Menlo, Consolas, 'Courier New', monospace;"><pre>'''.encode('utf-8'),
+        stacks.replace('<', '&lt;').replace('>', '&gt;').encode('utf-8'),
+        b'</pre></div></body></html>'
+    ]
+
 current_app = None
 def get_app(config_ins):
     global current_app
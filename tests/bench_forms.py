@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+__author__ = 'SLZ'
+
+'''
+Microbenchmark of urlencoded form parsing by number of fields, stdlib only.
+
+    python tests/bench_forms.py
+    python tests/bench_forms.py --fields 10 100 1000 10000
+
+Each request builds a Request from a POST body and reads the first field, the last field
+and a query string parameter.
+'''
+
+import io
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from digwebs.request import Request
+
+def make_body(count):
+    return '&'.join('field%d=value+%d%%21' % (i, i) for i in range(count)).encode()
+
+def bench(count, number):
+    '''
+    Return the mean time in microseconds of parsing one form of count fields.
+    '''
+    body = make_body(count)
+    last = 'field%d' % (count - 1)
+
+    def one():
+        r = Request({'REQUEST_METHOD': 'POST', 'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+                     'CONTENT_LENGTH': str(len(body)), 'QUERY_STRING': 'q=1', 'wsgi.input': io.BytesIO(body)})
+        return r.get('field0'), r.gets('q'), r.input().get(last)
+
+    one()
+    start = time.perf_counter()
+    for i in range(number):
+        one()
+    return (time.perf_counter() - start) / number * 1e6
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time urlencoded form parsing.')
+    parser.add_argument('--fields', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('-n', '--number', type=int, default=20000,
+                        help='number of fields parsed per size, split into requests')
+    args = parser.parse_args(argv)
+    print('%8s %12s %12s' % ('fields', 'us/request', 'ns/field'))
+    for count in args.fields:
+        t = bench(count, max(20, args.number // count))
+        print('%8d %12.1f %12.1f' % (count, t, t * 1e3 / count))
+
+if __name__ == '__main__':
+    main()
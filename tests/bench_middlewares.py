@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+__author__ = 'SLZ'
+
+'''
+Microbenchmark of the overhead of the middleware chain by its depth, stdlib only.
+
+    python tests/bench_middlewares.py
+    python tests/bench_middlewares.py --depths 1 5 20 50
+
+Each middleware only returns next(), the last one returns the body. The time of a whole
+WSGI request is printed too, with the same chain and no router.
+'''
+
+import io
+import os
+import sys
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from digwebs.web import digwebs
+
+def _pass(ctx, next):
+    return next()
+
+def _body(ctx, next):
+    return b'ok'
+
+def make_app(depth):
+    app = digwebs(root_path=os.getcwd(), template_folder=None, middlewares_folder=None)
+    app.middleware = [(_pass, i) for i in range(depth)] + [(_body, depth)]
+    return app
+
+def bench(depth, number):
+    '''
+    Return the mean time in microseconds of one call of the chain and of one WSGI request.
+    '''
+    app = make_app(depth)
+    chain = app._build_pipeline()
+    wsgi = app.get_wsgi_application()
+    env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/', 'QUERY_STRING': '', 'wsgi.input': io.BytesIO()}
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    chain_time = min(timeit.repeat(chain, number=number, repeat=3)) / number * 1e6
+    wsgi_time = min(timeit.repeat(lambda: wsgi(env, start_response), number=number, repeat=3)) / number * 1e6
+    return chain_time, wsgi_time
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the middleware chain by depth.')
+    parser.add_argument('--depths', type=int, nargs='+', default=[1, 5, 20])
+    parser.add_argument('-n', '--number', type=int, default=20000)
+    args = parser.parse_args(argv)
+    base = bench(0, args.number)
+    print('%6s %12s %16s %12s' % ('depth', 'chain us', 'per middleware', 'request us'))
+    for depth in args.depths:
+        chain_time, wsgi_time = bench(depth, args.number)
+        print('%6d %12.3f %16.3f %12.2f' % (depth, chain_time, (chain_time - base[0]) / depth, wsgi_time))
+
+if __name__ == '__main__':
+    main()
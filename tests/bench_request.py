@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+__author__ = 'SLZ'
+
+'''
+Allocations and time of a Request by request, measured with tracemalloc, stdlib only.
+
+    python tests/bench_request.py
+    python tests/bench_request.py --headers 50 -n 5000
+
+Each request reads the path, the host, a few headers and cookies three times, the way
+a handler and its middlewares do.
+'''
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from digwebs.request import Request
+
+def make_environ(headers):
+    env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/blog/a%20b/comments', 'QUERY_STRING': 'page=2',
+           'HTTP_HOST': 'example.com', 'HTTP_USER_AGENT': 'Mozilla/5.0', 'HTTP_ACCEPT': 'text/html',
+           'HTTP_ACCEPT_ENCODING': 'gzip, br', 'HTTP_COOKIE': 'session=abc123; theme=dark; lang=en',
+           'wsgi.url_scheme': 'http'}
+    for i in range(headers):
+        env['HTTP_X_CUSTOM_%d' % i] = 'v%d' % i
+    return env
+
+def handle(env):
+    r = Request(env)
+    for i in range(3):
+        r.path_info
+        r.host
+        r.headers['ACCEPT']
+        r.header('User-Agent')
+        r.cookies.get('session')
+        r.cookie('theme')
+    return r
+
+def bench(env, number):
+    '''
+    Return the retained bytes, the peak bytes and the time in microseconds of one request.
+    '''
+    handle(env)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    keep = [handle(env) for i in range(number)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(s.size_diff for s in after.compare_to(before, 'filename')) / number
+    del keep
+
+    tracemalloc.start()
+    peak = 0
+    for i in range(number):
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        handle(env)
+        peak += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for i in range(number * 10):
+        handle(env)
+    return retained, peak / number, (time.perf_counter() - start) / (number * 10) * 1e6
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure the allocations of a Request.')
+    parser.add_argument('--headers', type=int, default=20, help='extra X-Custom headers')
+    parser.add_argument('-n', '--number', type=int, default=2000)
+    args = parser.parse_args(argv)
+    retained, peak, t = bench(make_environ(args.headers), args.number)
+    print('retained bytes/request %d, peak bytes/request %d, %.2f us/request' % (retained, peak, t))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+__author__ = 'SLZ'
+
+'''
+Microbenchmark of dynamic route lookup by route engine and number of routes, stdlib only.
+
+    python tests/bench_routes.py
+    python tests/bench_routes.py --routes 10 100 1000 10000 --engines trie
+
+The route caches are disabled, so every lookup walks the dispatcher. The url hits the
+last route added, the worst case of the list scan.
+'''
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from digwebs.router import Router
+
+def _handler(path):
+    def fn(*args):
+        return args
+    fn.__web_route__ = path
+    fn.__web_method__ = 'GET'
+    return fn
+
+def make_router(engine, count):
+    router = Router(False, engine, 0, 0)
+    for i in range(count):
+        router.create_route(_handler('/api/r%d/:id' % i))
+    return router
+
+def bench(engine, count, lookups):
+    '''
+    Return the mean time of one lookup in microseconds.
+    '''
+    router = make_router(engine, count)
+    url = '/api/r%d/7' % (count - 1)
+    route_to = router.route_to
+    start = time.perf_counter()
+    for i in range(lookups):
+        route_to('GET', url)
+    return (time.perf_counter() - start) / lookups * 1e6
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time dynamic route lookups.')
+    parser.add_argument('--routes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--engines', nargs='+', default=['list', 'regex', 'trie'])
+    parser.add_argument('-n', '--lookups', type=int, default=20000)
+    args = parser.parse_args(argv)
+    print('%8s' % 'routes' + ''.join('%12s' % e for e in args.engines) + '   (us per lookup)')
+    for count in args.routes:
+        print('%8d' % count + ''.join('%12.2f' % bench(e, count, args.lookups) for e in args.engines))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+__author__ = 'SLZ'
+
+'''
+Throughput of a large static file over loopback, served by the built-in server, stdlib only.
+
+    python tests/bench_static.py
+    python tests/bench_static.py --size 500 --downloads 10 --http11
+
+The file is downloaded once sent by os.sendfile through wsgi.file_wrapper, and once read
+in blocks, as happens when the server provides no wsgi.file_wrapper.
+'''
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import http.client
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from digwebs.web import digwebs
+from digwebs.static import serve_file
+from digwebs.server import ThreadPoolWSGIServer, RequestHandler, HTTP11RequestHandler
+
+class _QuietHandler(RequestHandler):
+    def log_message(self, *args):
+        pass
+
+class _QuietHTTP11Handler(HTTP11RequestHandler):
+    def log_message(self, *args):
+        pass
+
+def make_app(fpath, sendfile):
+    app = digwebs(root_path=os.getcwd(), template_folder=None, middlewares_folder=None)
+    app.middleware = [(lambda ctx, next: serve_file(ctx, fpath), 0)]
+    wsgi = app.get_wsgi_application()
+    if sendfile:
+        return wsgi
+
+    def without_file_wrapper(env, start_response):
+        env.pop('wsgi.file_wrapper', None)
+        return wsgi(env, start_response)
+    return without_file_wrapper
+
+def bench(fpath, sendfile, downloads, http11):
+    '''
+    Return the throughput in MB/s of downloading the file downloads times.
+    '''
+    server = ThreadPoolWSGIServer(('127.0.0.1', 0), _QuietHTTP11Handler if http11 else _QuietHandler, threads=2)
+    server.set_app(make_app(fpath, sendfile))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        size = 0
+        start = time.perf_counter()
+        for i in range(downloads):
+            c = http.client.HTTPConnection('127.0.0.1', server.server_port)
+            c.request('GET', '/big.bin')
+            r = c.getresponse()
+            while True:
+                data = r.read(1024 * 1024)
+                if not data:
+                    break
+                size += len(data)
+            c.close()
+        return size / 1e6 / (time.perf_counter() - start)
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time downloads of a large static file.')
+    parser.add_argument('--size', type=int, default=100, help='file size in MB')
+    parser.add_argument('--downloads', type=int, default=5)
+    parser.add_argument('--http11', action='store_true', help='use HTTP11RequestHandler')
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as root:
+        fpath = os.path.join(root, 'big.bin')
+        with open(fpath, 'wb') as f:
+            for i in range(args.size):
+                f.write(os.urandom(1024 * 1024))
+        for name, sendfile in (('sendfile', True), ('blocks', False)):
+            print('%10s %10.0f MB/s' % (name, bench(fpath, sendfile, args.downloads, args.http11)))
+
+if __name__ == '__main__':
+    main()
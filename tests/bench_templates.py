@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+__author__ = 'SLZ'
+
+'''
+Count the stat calls and time of a template render with and without auto_reload, stdlib
+and jinja2 only.
+
+    python tests/bench_templates.py
+    python tests/bench_templates.py -n 50000
+
+digwebs sets auto_reload=is_develop_mode, so the first row is develop mode and the second
+production.
+'''
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from digwebs.template import Jinja2TemplateEngine
+
+TEMPLATE = '<ul>{% for i in items %}<li>{{{{ name }}}} {{{{ i }}}}</li>{% endfor %}</ul>'
+
+def bench(templ_dir, auto_reload, number):
+    '''
+    Return the os.stat calls by render and the mean time of a render in microseconds.
+    '''
+    engine = Jinja2TemplateEngine(templ_dir, auto_reload=auto_reload)
+    model = dict(name='Michael', items=range(10))
+    engine('page.html', model)
+    calls = [0]
+    stat = os.stat
+
+    def counting_stat(*args, **kw):
+        calls[0] += 1
+        return stat(*args, **kw)
+
+    os.stat = counting_stat
+    try:
+        start = time.perf_counter()
+        for i in range(number):
+            engine('page.html', model)
+        elapsed = time.perf_counter() - start
+    finally:
+        os.stat = stat
+    return calls[0] / number, elapsed / number * 1e6
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Count stat calls of template renders.')
+    parser.add_argument('-n', '--number', type=int, default=10000)
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as templ_dir:
+        with open(os.path.join(templ_dir, 'page.html'), 'w') as f:
+            f.write(TEMPLATE)
+        print('%12s %14s %12s' % ('auto_reload', 'stat/render', 'us/render'))
+        for auto_reload in (True, False):
+            stats, t = bench(templ_dir, auto_reload, args.number)
+            print('%12s %14.2f %12.2f' % (auto_reload, stats, t))
+
+if __name__ == '__main__':
+    main()
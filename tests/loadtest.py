@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+__author__ = 'SLZ'
+
+'''
+Load test of a running digwebs server, stdlib only.
+
+Start the application, e.g. with app.run(port=9999, workers=4, threads=8), then:
+
+    python tests/loadtest.py http://127.0.0.1:9999/ -n 5000 -c 32
+    python tests/loadtest.py http://127.0.0.1:9999/ -n 5000 -c 32 --keep-alive
+
+--keep-alive reuses one connection per client, which needs a server run with http11=True.
+'''
+
+import sys
+import time
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+def _client(url, count, keep_alive, latencies, errors):
+    parts = urlsplit(url)
+    path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+    headers = {} if keep_alive else {'Connection': 'close'}
+    conn = None
+    for i in range(count):
+        if conn is None:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path, headers=headers)
+            r = conn.getresponse()
+            r.read()
+            if r.status >= 400:
+                errors.append(r.status)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(e)
+            conn.close()
+            conn = None
+            continue
+        latencies.append(time.perf_counter() - start)
+        if not keep_alive or r.will_close:
+            conn.close()
+            conn = None
+    if conn is not None:
+        conn.close()
+
+def run(url, requests, concurrency, keep_alive=False):
+    '''
+    Send requests GET requests to url from concurrency threads, return a dict summary
+    with rps, latency percentiles in ms and the number of errors.
+    '''
+    latencies = []
+    errors = []
+    per_client = max(1, requests // concurrency)
+    threads = [threading.Thread(target=_client, args=(url, per_client, keep_alive, latencies, errors))
+               for i in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def percentile(p):
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return dict(
+        requests=len(latencies) + len(errors),
+        errors=len(errors),
+        seconds=elapsed,
+        rps=len(latencies) / elapsed,
+        p50=percentile(0.5),
+        p99=percentile(0.99),
+        max=percentile(1.0))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test a running digwebs server.')
+    parser.add_argument('url')
+    parser.add_argument('-n', '--requests', type=int, default=2000, help='total number of requests')
+    parser.add_argument('-c', '--concurrency', type=int, default=16, help='number of concurrent clients')
+    parser.add_argument('-k', '--keep-alive', action='store_true', help='reuse connections (needs http11=True)')
+    args = parser.parse_args(argv)
+    r = run(args.url, args.requests, args.concurrency, args.keep_alive)
+    print('%(requests)d requests in %(seconds).2fs, %(errors)d errors' % r)
+    print('%(rps).0f req/s, latency p50 %(p50).1f ms, p99 %(p99).1f ms, max %(max).1f ms' % r)
+    return 1 if r['errors'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())